@@ -0,0 +1,92 @@
+"""
+Measure ingest throughput on a synthetic corpus: chunking with
+transform_fetched_pages, then embedding and storing with embed_chunks into a
+throwaway Chroma directory, a second unchanged run (hash skipping), a rebuild
+of the emptied collection from the embedding cache, and the snapshot export.
+
+By default embeddings come from a hashing function so the benchmark runs
+offline and isolates the pipeline's own cost; --embedding default uses the
+real model, so chunks/s reflects what the nightly job sees on this machine.
+
+    python benchmarks/bench_ingest.py --pages 200 --sections 12 --depth 4
+    python benchmarks/bench_ingest.py --pages 200 --embedding default
+    python benchmarks/bench_ingest.py --pages 1000 --workers 0 --skip-embed
+"""
+
+import argparse
+import contextlib
+import io
+import time
+
+from harness import peak_rss_mb, use_hash_embeddings, use_throwaway_store
+from synthetic_corpus import generate_pages
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    # embed_chunks prints a line per batch; keep the report readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunking and embedding throughput.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--sections", type=int, default=8, help="headings per page")
+    parser.add_argument("--depth", type=int, default=3, help="deepest heading level")
+    parser.add_argument("--blocks", type=int, default=3, help="content blocks per heading")
+    parser.add_argument("--words", type=int, default=20, help="words per sentence")
+    parser.add_argument("--boilerplate", type=float, default=0.3, help="share of pages with a shared template section")
+    parser.add_argument("--workers", type=int, default=1, help="transform processes (0 = one per CPU)")
+    parser.add_argument("--embedding", default="hash", choices=["hash", "default"],
+                        help="hash: offline hashing embeddings; default: the real embedding model")
+    parser.add_argument("--skip-embed", action="store_true", help="only measure chunking")
+    args = parser.parse_args()
+
+    workdir = use_throwaway_store()
+
+    from injest import embedder
+    from injest.metrics import metrics
+    from injest.snapshot import publish_snapshot
+    from injest.transformer import transform_fetched_pages
+
+    if args.embedding == "hash":
+        use_hash_embeddings()
+
+    pages = generate_pages(args.pages, args.sections, args.depth, args.blocks, args.words, boilerplate=args.boilerplate)
+    body_mb = sum(len(page["body"]["storage"]["value"]) for page in pages) / (1024 * 1024)
+    print(f"{args.pages} pages ({body_mb:.1f} MiB of storage HTML) in {workdir}\n")
+
+    chunks, elapsed = timed(transform_fetched_pages, pages, workers=args.workers)
+    print(
+        f"{'transform':<16} {elapsed:8.2f} s   {args.pages / elapsed:9.1f} pages/s   "
+        f"{len(chunks) / elapsed:9.1f} chunks/s   ({len(chunks)} chunks)"
+    )
+
+    if not args.skip_embed:
+        def embed(label):
+            before = dict(metrics.counts)
+            (stats, _), elapsed = timed(embedder.embed_chunks, chunks)
+            embedded = metrics.counts.get("texts_embedded", 0) - before.get("texts_embedded", 0)
+            print(
+                f"{label:<16} {elapsed:8.2f} s   {len(chunks) / elapsed:9.1f} chunks/s   "
+                f"{embedded} texts embedded   {stats}"
+            )
+
+        embed("embed (first)")
+        embed("embed (rerun)")
+        # Same chunks into empty collections: everything comes from the embedding cache.
+        for collection in embedder.all_collections():
+            embedder.client.delete_collection(collection.name)
+        embed("embed (cached)")
+
+        _, elapsed = timed(publish_snapshot)
+        print(f"{'snapshot':<16} {elapsed:8.2f} s")
+
+    print(f"\nPeak RSS: {peak_rss_mb():.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
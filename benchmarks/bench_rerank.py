@@ -0,0 +1,109 @@
+"""
+Measure what diversity reranking does to retrieved context.
+
+A synthetic corpus is ingested into a throwaway Chroma directory and
+published as a snapshot, then the same questions are retrieved with and
+without reranking through ikb_backend.retrieval. Reports distinct pages per
+question, how similar the returned chunks are to each other, how many are
+contained in another returned chunk (a parent section repeating its
+sub-section), the estimated tokens build_context puts into the prompt, and
+retrieval latency.
+
+    python benchmarks/bench_rerank.py --pages 300 --questions 100
+    python benchmarks/bench_rerank.py --mmr-lambda 0.5 --max-per-page 1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import time
+
+import numpy as np
+
+from bench_server import questions
+from harness import latency_summary, use_hash_embeddings, use_throwaway_store
+from synthetic_corpus import generate_pages
+
+
+def redundancy(results, embeddings):
+    """Mean pairwise cosine similarity of the results and how many are contained in another."""
+    if len(results) < 2:
+        return 0.0, 0
+    vectors = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    mean = float(similarity[np.triu_indices(len(results), 1)].mean())
+    texts = [" ".join(r["content"].split()) for r in results]
+    nested = sum(
+        any(i != j and text in other for j, other in enumerate(texts))
+        for i, text in enumerate(texts)
+    )
+    return mean, nested
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare retrieval with and without diversity reranking.")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--sections", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--n-results", type=int, default=6)
+    parser.add_argument("--mode", default="vector", choices=["vector", "hybrid"], help="IKB_RETRIEVAL_MODE")
+    parser.add_argument("--mmr-lambda", type=float, default=None, help="default: IKB_MMR_LAMBDA")
+    parser.add_argument("--max-per-page", type=int, default=None, help="default: IKB_MAX_CHUNKS_PER_PAGE")
+    args = parser.parse_args()
+
+    workdir = use_throwaway_store()
+    os.environ["IKB_VECTOR_ENGINE"] = "snapshot"
+    os.environ["IKB_RETRIEVAL_MODE"] = args.mode
+
+    from injest import embedder
+    from injest.snapshot import publish_snapshot
+    from injest.transformer import transform_fetched_pages
+    from ikb_backend.context import build_context, estimate_tokens
+    from ikb_backend.db import embed_query, get_embeddings
+    from ikb_backend.retrieval import retrieve
+
+    use_hash_embeddings()
+    print(f"Ingesting {args.pages} synthetic pages into {workdir} ...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunks = transform_fetched_pages(generate_pages(args.pages, sections=args.sections, depth=args.depth))
+        embedder.embed_chunks(chunks)
+        publish_snapshot()
+    print(f"Indexed {len(chunks)} chunks.")
+
+    overrides = {
+        key: value for key, value in (("mmr_lambda", args.mmr_lambda), ("max_per_page", args.max_per_page))
+        if value is not None
+    }
+    prompts = questions(args.questions)
+    embeddings = [embed_query(prompt) for prompt in prompts]
+
+    async def run(rerank_results):
+        rows = []
+        for prompt, embedding in zip(prompts, embeddings):
+            started = time.perf_counter()
+            results = await retrieve(prompt, embedding, args.n_results, rerank_results, **overrides)
+            elapsed = (time.perf_counter() - started) * 1000
+            similarity, nested = redundancy(results, get_embeddings([r["id"] for r in results]))
+            context, _ = build_context(results)
+            rows.append((elapsed, len(results), len({r["page_title"] for r in results}),
+                         similarity, nested, estimate_tokens(context)))
+        return rows
+
+    runs = {label: asyncio.run(run(rerank_results)) for label, rerank_results in (("plain", False), ("reranked", True))}
+
+    print(f"\n{args.questions} questions, {args.mode} retrieval, top {args.n_results}\n")
+    print(f"{'':10} {'results':>8} {'pages':>6} {'similarity':>10} {'nested':>7} {'ctx tokens':>10}")
+    for label, rows in runs.items():
+        means = [statistics.mean(row[i] for row in rows) for i in range(1, 6)]
+        print(f"{label:10} {means[0]:8.2f} {means[1]:6.2f} {means[2]:10.3f} {means[3]:7.2f} {means[4]:10.0f}")
+    print()
+    for label, rows in runs.items():
+        print(latency_summary(label, [row[0] for row in rows]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare query latency of the Chroma collections with the in-memory snapshot
+engine (IKB_VECTOR_ENGINE=snapshot) on a synthetic corpus, across every
+space and scoped to one.
+
+Random unit vectors are spread over --spaces space partitions of a throwaway
+store through the ingest pipeline's own embedder module, exported with
+publish_snapshot, and queried through both engines of ikb_backend.db with
+the same query vectors. No embedding model or Ollama is needed.
+
+    python benchmarks/bench_retrieval.py --chunks 20000 --queries 200
+    python benchmarks/bench_retrieval.py --spaces 1 --dtype float16 --batch 16
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from harness import latency_summary, use_throwaway_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma vs snapshot vector search.")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384, help="all-MiniLM-L6-v2 produces 384 dimensions")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=8, help="queries per batched snapshot search")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    parser.add_argument("--spaces", type=int, default=8, help="space partitions the chunks are spread over")
+    args = parser.parse_args()
+
+    workdir = use_throwaway_store()
+
+    from injest.embedder import partition_collection
+    from injest.snapshot import publish_snapshot
+    from ikb_backend import db
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.chunks, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    print(f"Loading {args.chunks} chunks into {args.spaces} spaces in {workdir} ...")
+    spaces = [f"S{i}" for i in range(args.spaces)]
+    batch = 4096
+    for start in range(0, args.chunks, batch):
+        ids = [f"{i}-0" for i in range(start, min(start + batch, args.chunks))]
+        for s, space in enumerate(spaces):
+            rows = [i for i in range(len(ids)) if (start + i) % len(spaces) == s]
+            if not rows:
+                continue
+            partition_collection(space).add(
+                ids=[ids[i] for i in rows],
+                embeddings=vectors[[start + i for i in rows]],
+                documents=[f"chunk {ids[i]}" for i in rows],
+                metadatas=[{"title": ids[i], "pageTitle": "bench", "spaceKey": space} for i in rows],
+            )
+
+    started = time.perf_counter()
+    publish_snapshot(dtype=args.dtype, batch_size=4096)
+    print(f"Published snapshot in {time.perf_counter() - started:.2f} s")
+
+    started = time.perf_counter()
+    db.vector_index.snapshot()
+    print(f"Loaded snapshot in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    def measure(engine, scope=None, batch=1):
+        db.VECTOR_ENGINE = engine
+        timings, ids = [], []
+        for start in range(0, args.queries, batch):
+            chunk = queries[start:start + batch]
+            started = time.perf_counter()
+            results = db.semantic_search_batch(list(chunk), args.k, scope)
+            elapsed = (time.perf_counter() - started) * 1000
+            timings.extend([elapsed / len(chunk)] * len(chunk))
+            ids.extend([r["id"] for r in hits] for hits in results)
+        return timings, ids
+
+    scope = (spaces[0],)
+    chroma_ms, chroma_ids = measure("chroma")
+    chroma_scoped_ms, _ = measure("chroma", scope)
+    snapshot_ms, snapshot_ids = measure("snapshot")
+    snapshot_scoped_ms, _ = measure("snapshot", scope)
+    batched_ms, _ = measure("snapshot", batch=args.batch)
+
+    # HNSW is approximate; report how much of its top k the exact scan shares.
+    overlap = statistics.mean(
+        len(set(a) & set(b)) / args.k for a, b in zip(chroma_ids, snapshot_ids)
+    )
+
+    print(f"\n{args.chunks} chunks x {args.dim} dims in {args.spaces} spaces, top {args.k}, {args.queries} queries\n")
+    print(latency_summary("chroma", chroma_ms))
+    print(latency_summary("chroma (1 space)", chroma_scoped_ms))
+    print(latency_summary("snapshot", snapshot_ms))
+    print(latency_summary("snapshot (1 space)", snapshot_scoped_ms))
+    print(latency_summary(f"snapshot (batch {args.batch})", batched_ms))
+    print(f"\nTop-{args.k} overlap with Chroma: {overlap:.1%}")
+
+
+if __name__ == "__main__":
+    main()
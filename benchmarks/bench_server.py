@@ -0,0 +1,153 @@
+"""
+Load-test the FastAPI app end to end against a stub Ollama server.
+
+A synthetic corpus is ingested into a throwaway Chroma directory through the
+ingest pipeline's own modules, the app is served by uvicorn in this process
+with OLLAMA_URLS pointing at benchmarks/stub_ollama.py, and a fixed number of
+unique questions is sent at a given concurrency. Reports throughput, latency
+percentiles (time to first token too with --stream), status codes and peak
+RSS of the process (server, stub and client together; the stub and client
+are small next to the embedding model and Chroma).
+
+    python benchmarks/bench_server.py --requests 200 --concurrency 16
+    python benchmarks/bench_server.py --stream --engine chroma --token-ms 2 --tokens 120
+"""
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import threading
+import time
+
+from harness import latency_summary, peak_rss_mb, use_hash_embeddings, use_throwaway_store
+from stub_ollama import StubOllama, serve
+from synthetic_corpus import WORDS, generate_pages
+
+
+def questions(count, seed=0):
+    # Unique so neither the answer cache nor the micro-batcher sees repeats.
+    rng = random.Random(seed)
+    return [
+        f"How do I {rng.choice(WORDS)} the {rng.choice(WORDS)} {rng.choice(WORDS)} for {rng.choice(WORDS)}? ({i})"
+        for i in range(count)
+    ]
+
+
+async def ask(client, question, stream):
+    """Send one question; returns (status, total ms, first-token ms or None)."""
+    started = time.perf_counter()
+    payload = {"prompt": question, "context": ""}
+    if not stream:
+        response = await client.post("/v1/chat", json=payload)
+        return response.status_code, (time.perf_counter() - started) * 1000, None
+
+    first_token = None
+    async with client.stream("POST", "/v1/chat/stream", json=payload) as response:
+        async for line in response.aiter_lines():
+            if first_token is None and line.startswith("data:") and '"token"' in line:
+                first_token = (time.perf_counter() - started) * 1000
+            if line.startswith("event: error"):
+                return "error event", (time.perf_counter() - started) * 1000, first_token
+    return response.status_code, (time.perf_counter() - started) * 1000, first_token
+
+
+async def run_load(base_url, prompts, concurrency, stream, timeout):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        queue = collections.deque(prompts)
+        results = []
+
+        async def worker():
+            while queue:
+                question = queue.popleft()
+                try:
+                    results.append(await ask(client, question, stream))
+                except httpx.HTTPError as e:
+                    results.append((type(e).__name__, 0.0, None))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        stats = (await client.get("/v1/stats")).json()
+    return results, elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat API against a stub Ollama.")
+    parser.add_argument("--pages", type=int, default=200, help="synthetic pages to ingest")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stream", action="store_true", help="use /v1/chat/stream and report time to first token")
+    parser.add_argument("--engine", default="snapshot", choices=["chroma", "snapshot"], help="IKB_VECTOR_ENGINE")
+    parser.add_argument("--embedding", default="hash", choices=["hash", "default"],
+                        help="hash: offline hashing embeddings; default: the real embedding model")
+    parser.add_argument("--cache", action="store_true", help="keep the answer cache enabled")
+    parser.add_argument("--prefill-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--tokens", type=int, default=80)
+    parser.add_argument("--parallel", type=int, default=4, help="generations the stub runs at once")
+    parser.add_argument("--timeout", type=float, default=120.0, help="client timeout per request in seconds")
+    args = parser.parse_args()
+
+    workdir = use_throwaway_store()
+    stub = StubOllama(args.prefill_ms, 0.05, args.token_ms, args.tokens, args.parallel)
+    stub_server = serve(stub, port=0)
+    # Module settings are read at import time, so configure before importing the app.
+    os.environ["OLLAMA_URLS"] = f"http://127.0.0.1:{stub_server.server_address[1]}"
+    os.environ["IKB_VECTOR_ENGINE"] = args.engine
+    os.environ.setdefault("IKB_CACHE_ENABLED", "1" if args.cache else "0")
+
+    import uvicorn
+    from injest import embedder
+    from injest.snapshot import publish_snapshot
+    from injest.transformer import transform_fetched_pages
+    from ikb_backend.server import app
+
+    if args.embedding == "hash":
+        use_hash_embeddings()
+
+    print(f"Ingesting {args.pages} synthetic pages into {workdir} ...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunks = transform_fetched_pages(generate_pages(args.pages))
+        embedder.embed_chunks(chunks)
+        publish_snapshot()
+    print(f"Indexed {len(chunks)} chunks.")
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    results, elapsed, stats = asyncio.run(run_load(
+        f"http://127.0.0.1:{port}", questions(args.requests), args.concurrency, args.stream, args.timeout,
+    ))
+    server.should_exit = True
+    stub_server.shutdown()
+
+    statuses = collections.Counter(status for status, _, _ in results)
+    ok = [(total, first) for status, total, first in results if status == 200]
+    mode = "stream" if args.stream else "chat"
+    print(
+        f"\n{args.requests} {mode} requests, concurrency {args.concurrency}, engine {args.engine}, "
+        f"stub prefill {args.prefill_ms:g} ms + {args.tokens} tokens x {args.token_ms:g} ms, parallel {args.parallel}\n"
+    )
+    print(f"Throughput: {len(ok) / elapsed:.1f} req/s over {elapsed:.2f} s")
+    print(f"Statuses:   {dict(statuses)}")
+    print(latency_summary("latency", [total for total, _ in ok]))
+    if args.stream:
+        print(latency_summary("time to first token", [first for _, first in ok if first is not None]))
+    print(f"Concurrency: {json.dumps(stats['concurrency'])}")
+    print(f"Stub Ollama: {stub.requests} generations, at most {stub.max_active} at once")
+    print(f"\nPeak RSS: {peak_rss_mb():.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
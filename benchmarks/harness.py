@@ -0,0 +1,109 @@
+"""
+Shared helpers for the benchmark scripts: a throwaway data directory, an
+offline embedding function, latency percentiles and peak memory.
+"""
+
+import hashlib
+import os
+import re
+import resource
+import statistics
+import sys
+import tempfile
+
+import numpy as np
+from chromadb import EmbeddingFunction
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def use_throwaway_store(prefix="ikb-bench-"):
+    """
+    Point the backend and the ingest pipeline at a fresh temporary Chroma
+    directory and make both importable. Must run before either is imported,
+    since their paths are read at import time.
+
+    Returns:
+        str: The temporary directory
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    store = os.path.join(workdir, "chroma_db")
+    os.environ["CHROMA_PATH"] = store
+    os.environ["IKB_CHROMA_PATH"] = store
+    # Chroma's telemetry retries noisily when there is no network.
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    for path in (ROOT, os.path.join(ROOT, "embedding-cron-jobs")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return workdir
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """
+    Hashing-trick bag of words: no model download and ~100x faster than
+    all-MiniLM-L6-v2, with the same dimension, so benchmarks run offline and
+    measure everything except the model itself. Texts sharing words still
+    land near each other, which keeps retrieval results meaningful.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = np.zeros((len(input), self.dim), dtype=np.float32)
+        for row, text in enumerate(input):
+            for word in re.findall(r"\w+", text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return list(vectors / np.maximum(norms, 1e-9))
+
+    @staticmethod
+    def name():
+        return "ikb-bench-hash"
+
+    def get_config(self):
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config):
+        return HashEmbeddingFunction(config.get("dim", 384))
+
+
+def use_hash_embeddings():
+    """
+    Switch the already imported ingest embedder and backend db modules to
+    HashEmbeddingFunction. Only for a fresh store: the collection, created
+    empty on import with the default function, is recreated; partitions are
+    created later with the function set here.
+    """
+    embedding_function = HashEmbeddingFunction()
+    modules = [sys.modules.get(name) for name in ("injest.embedder", "ikb_backend.db")]
+    modules = [module for module in modules if module is not None]
+    for module in modules:
+        module.embedding_function = embedding_function
+    embedder = sys.modules["injest.embedder"]
+    embedder.client.delete_collection(embedder.COLLECTION_NAME)
+    embedder.collection = embedder.partition_collection("")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def latency_summary(name, samples_ms):
+    if not samples_ms:
+        return f"{name:<22} no samples"
+    return (
+        f"{name:<22} mean {statistics.mean(samples_ms):8.3f} ms   "
+        f"p50 {percentile(samples_ms, 50):8.3f} ms   p95 {percentile(samples_ms, 95):8.3f} ms   "
+        f"p99 {percentile(samples_ms, 99):8.3f} ms"
+    )
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
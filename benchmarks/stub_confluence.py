@@ -0,0 +1,197 @@
+"""
+Minimal stand-in for the Confluence Cloud REST API, for running the ingest
+pipeline without a real wiki.
+
+Serves the endpoints the fetcher uses (space listing, content listing with
+start/limit pagination, CQL content search on lastmodified, and single page
+fetches) from a JSON file of page objects. The file is re-read on every request, so editing
+it between pipeline runs simulates edits and deletions.
+
+    python benchmarks/stub_confluence.py --pages pages.json --port 8090
+    CONFLUENCE_BASE_URL=http://127.0.0.1:8090/wiki CONFLUENCE_USER=x CONFLUENCE_TOKEN=x \
+        python -m injest.pipeline
+
+GET /_stats returns per-endpoint request counts. --throttle-every N answers
+every Nth request with 429 and a Retry-After header to exercise backoff.
+"""
+
+import argparse
+import json
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+CONTEXT_PATH = "/wiki"
+
+_CQL_LASTMODIFIED = re.compile(r'lastmodified\s*>=\s*"([^"]+)"')
+
+SAMPLE_PAGES = [
+    {
+        "id": "1001",
+        "title": "Deploying to staging",
+        "space": {"key": "ENG"},
+        "version": {"number": 1, "when": "2025-08-01T10:00:00.000Z"},
+        "body": {"storage": {"value": "<h1>Deploy</h1><p>Run make deploy-staging.</p>"}},
+    },
+    {
+        "id": "1002",
+        "title": "PTO process",
+        "space": {"key": "HR"},
+        "version": {"number": 1, "when": "2025-08-02T10:00:00.000Z"},
+        "body": {"storage": {"value": "<h1>PTO</h1><p>Request PTO in the HR portal.</p>"}},
+    },
+]
+
+
+def _parse_when(when):
+    return datetime.fromisoformat(when.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def _render_page(page, expand):
+    rendered = {"id": page["id"], "type": "page", "title": page["title"]}
+    if "space" in page:
+        rendered["space"] = page["space"]
+    if "version" in expand:
+        rendered["version"] = page["version"]
+    if "body.storage" in expand:
+        rendered["body"] = page["body"]
+    return rendered
+
+
+class StubConfluence:
+    def __init__(self, pages_path=None, pages=None, throttle_every=0):
+        self.pages_path = pages_path
+        self._pages = pages if pages is not None else SAMPLE_PAGES
+        self.throttle_every = throttle_every
+        self.requests = Counter()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def pages(self):
+        if self.pages_path:
+            with open(self.pages_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return self._pages
+
+    def count(self, endpoint):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def should_throttle(self):
+        with self._lock:
+            self._total += 1
+            return bool(self.throttle_every) and self._total % self.throttle_every == 0
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _listing(self, path, items, query, render=_render_page):
+            start = int(query.get("start", ["0"])[0])
+            limit = int(query.get("limit", ["25"])[0])
+            expand = query.get("expand", [""])[0].split(",")
+            window = items[start:start + limit]
+            links = {"base": f"http://{self.headers['Host']}{CONTEXT_PATH}"}
+            if start + limit < len(items):
+                next_query = {k: v[0] for k, v in query.items()}
+                next_query["start"] = start + limit
+                links["next"] = f"{path}?{urlencode(next_query)}"
+            return {
+                "results": [render(item, expand) for item in window],
+                "start": start,
+                "limit": limit,
+                "size": len(window),
+                "_links": links,
+            }
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            path = url.path[len(CONTEXT_PATH):] if url.path.startswith(CONTEXT_PATH) else url.path
+
+            if path == "/_stats":
+                return self._send_json(200, dict(stub.requests))
+
+            if stub.should_throttle():
+                stub.count("throttled")
+                body = b'{"message": "Rate limited"}'
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            pages = stub.pages()
+            if path == "/rest/api/space":
+                stub.count("space")
+                keys = sorted({p.get("space", {}).get("key", "DEFAULT") for p in pages})
+                spaces = [{"key": key, "name": key, "type": "global"} for key in keys]
+                return self._send_json(200, self._listing(path, spaces, query, render=lambda space, _: space))
+
+            if path == "/rest/api/content":
+                stub.count("content")
+                pages = [p for p in pages if not query.get("spaceKey")
+                         or p.get("space", {}).get("key", "DEFAULT") == query["spaceKey"][0]]
+                return self._send_json(200, self._listing(path, pages, query))
+
+            if path == "/rest/api/content/search":
+                stub.count("search")
+                match = _CQL_LASTMODIFIED.search(query.get("cql", [""])[0])
+                if match:
+                    since = datetime.strptime(match.group(1), "%Y/%m/%d %H:%M")
+                    pages = [p for p in pages if _parse_when(p["version"]["when"]) >= since]
+                return self._send_json(200, self._listing(path, pages, query))
+
+            if path.startswith("/rest/api/content/"):
+                stub.count("page")
+                page_id = path.rsplit("/", 1)[-1]
+                expand = query.get("expand", [""])[0].split(",")
+                for page in pages:
+                    if page["id"] == page_id:
+                        return self._send_json(200, _render_page(page, expand))
+                return self._send_json(404, {"message": f"No content with id {page_id}"})
+
+            self._send_json(404, {"message": f"Unknown path {url.path}"})
+
+    return Handler
+
+
+def serve(stub, host="127.0.0.1", port=8090):
+    """
+    Start the stub server on a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a stub Confluence REST API.")
+    parser.add_argument("--pages", help="JSON file with a list of page objects (default: built-in sample)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="answer every Nth request with 429 Retry-After: 1")
+    args = parser.parse_args()
+
+    stub = StubConfluence(args.pages, throttle_every=args.throttle_every)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    print(f"Stub Confluence listening on http://{args.host}:{args.port}{CONTEXT_PATH}")
+    server.serve_forever()
@@ -0,0 +1,170 @@
+"""
+Minimal stand-in for an Ollama server, for load-testing the backend without
+a GPU.
+
+Serves /api/generate (streaming NDJSON or a single JSON reply) and /api/tags.
+Latency is simulated: a fixed prefill cost plus a cost per prompt token
+(context tokens sent back from an earlier turn count as already cached),
+then a cost per generated token. --parallel limits how many generations run
+at once, like OLLAMA_NUM_PARALLEL; the rest queue.
+
+    python benchmarks/stub_ollama.py --port 11500 --prefill-ms 50 --token-ms 5 --tokens 80
+    OLLAMA_URLS=http://127.0.0.1:11500 python -m ikb_backend.server
+
+GET /_stats returns request counts and the highest concurrency seen.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER_WORDS = (
+    "Deploy with the release pipeline and watch the dashboard for errors before "
+    "promoting the build to production then confirm the rollback plan with the owner"
+).split()
+
+
+class StubOllama:
+    def __init__(self, prefill_ms=50.0, prompt_token_ms=0.05, token_ms=5.0, tokens=80, parallel=4):
+        self.prefill_ms = prefill_ms
+        self.prompt_token_ms = prompt_token_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self._slots = threading.Semaphore(max(parallel, 1))
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+
+    def answer_pieces(self):
+        words = " ".join(ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(max(self.tokens - 12, 1)))
+        text = json.dumps({"answer": words, "context_used": "stub", "confidence": "High", "notes": ""})
+        # Roughly four characters per token, like a subword tokenizer.
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def generate(self, body, emit):
+        """Simulate one generation, calling emit(chunk) for each NDJSON object."""
+        prompt = body.get("prompt", "")
+        context = body.get("context") or []
+        if not prompt:
+            # Model preload: nothing to generate.
+            emit({"model": body.get("model"), "done": True, "load_duration": 0})
+            return
+
+        with self._slots:
+            with self._lock:
+                self.requests += 1
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+            try:
+                prompt_tokens = (len(prompt) + len(body.get("system", ""))) // 4
+                prefill = (self.prefill_ms + self.prompt_token_ms * prompt_tokens) / 1000
+                time.sleep(prefill)
+                pieces = self.answer_pieces()
+                started = time.perf_counter()
+                for piece in pieces:
+                    time.sleep(self.token_ms / 1000)
+                    emit({"model": body.get("model"), "response": piece, "done": False})
+                emit({
+                    "model": body.get("model"),
+                    "response": "",
+                    "done": True,
+                    "context": list(context) + list(range(prompt_tokens + len(pieces))),
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(prefill * 1e9),
+                    "eval_count": len(pieces),
+                    "eval_duration": int((time.perf_counter() - started) * 1e9),
+                    "load_duration": 0,
+                })
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                return self._send_json(200, {"models": [{"name": "stub"}]})
+            if self.path == "/_stats":
+                return self._send_json(200, {
+                    "requests": stub.requests, "active": stub.active, "max_active": stub.max_active,
+                })
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", "0"))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path != "/api/generate":
+                return self._send_json(404, {"error": f"unknown path {self.path}"})
+
+            if not body.get("stream", True):
+                chunks = []
+                stub.generate(body, chunks.append)
+                final = dict(chunks[-1], response="".join(c.get("response", "") for c in chunks))
+                return self._send_json(200, final)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def emit(chunk):
+                line = (json.dumps(chunk) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            try:
+                stub.generate(body, emit)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The backend closes streams once it has the answer it needs.
+                self.close_connection = True
+
+    return Handler
+
+
+def serve(stub, host="127.0.0.1", port=11500):
+    """
+    Start the stub server on a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a stub Ollama API with simulated latency.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--prefill-ms", type=float, default=50.0, help="fixed cost before the first token")
+    parser.add_argument("--prompt-token-ms", type=float, default=0.05, help="extra prefill cost per prompt token")
+    parser.add_argument("--token-ms", type=float, default=5.0, help="cost per generated token")
+    parser.add_argument("--tokens", type=int, default=80, help="approximate tokens per answer")
+    parser.add_argument("--parallel", type=int, default=4, help="generations run at once; the rest queue")
+    args = parser.parse_args()
+
+    stub = StubOllama(args.prefill_ms, args.prompt_token_ms, args.token_ms, args.tokens, args.parallel)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    server.daemon_threads = True
+    print(f"Stub Ollama listening on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,123 @@
+"""
+Generate synthetic Confluence pages (storage-format bodies) for benchmarks.
+
+Pages get nested headings down to a configurable depth, paragraphs, bullet
+lists, code blocks and tables, with a sprinkling of identifiers (service
+names, env vars, error codes) so keyword search has something to find. The
+output is a JSON list of page objects that stub_confluence.py can serve.
+--boilerplate adds the same template section to a share of the pages, like
+the shared warnings and page templates of a real wiki.
+
+    python benchmarks/synthetic_corpus.py --pages 500 --sections 12 --depth 3 > pages.json
+    python benchmarks/synthetic_corpus.py --pages 500 --boilerplate 0.5 > pages.json
+"""
+
+import argparse
+import json
+import random
+
+WORDS = (
+    "service deploy cluster config token database cache queue worker release rollback "
+    "latency throughput request response endpoint schema migration index replica "
+    "backup restore alert dashboard runbook incident oncall owner team budget quota "
+    "staging production region network proxy certificate secret vault pipeline build "
+    "artifact registry image container node pod volume storage bucket retention policy"
+).split()
+
+BOILERPLATE = (
+    "<h2>Support and escalation</h2>"
+    "<p>This page is maintained by the platform team. For urgent production issues page the on-call "
+    "engineer through the incident channel. Do not share credentials or tokens on this page.</p>"
+)
+
+
+def _sentence(rng, words):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    if rng.random() < 0.3:
+        text += f" ERR-{rng.randint(1000, 9999)}"
+    if rng.random() < 0.2:
+        text += f" {rng.choice(WORDS).upper()}_{rng.choice(WORDS).upper()}_URL"
+    return text.capitalize() + "."
+
+
+def _block(rng, words):
+    kind = rng.random()
+    if kind < 0.6:
+        return f"<p>{' '.join(_sentence(rng, words) for _ in range(rng.randint(1, 4)))}</p>"
+    if kind < 0.8:
+        items = "".join(f"<li>{_sentence(rng, words // 2 or 1)}</li>" for _ in range(rng.randint(2, 6)))
+        return f"<ul>{items}</ul>"
+    if kind < 0.9:
+        lines = "\n".join(f"{rng.choice(WORDS)}-{i}: {rng.randint(1, 500)}" for i in range(rng.randint(3, 12)))
+        return f"<pre>{lines}</pre>"
+    rows = "".join(
+        f"<tr><td>{rng.choice(WORDS)}</td><td>{rng.randint(1, 100)}</td><td>{rng.choice(WORDS)}</td></tr>"
+        for _ in range(rng.randint(2, 8))
+    )
+    return f"<table><tbody><tr><th>Name</th><th>Value</th><th>Owner</th></tr>{rows}</tbody></table>"
+
+
+def generate_body(rng, sections=8, depth=3, blocks=3, words=20):
+    """
+    Build one storage-format body.
+
+    Args:
+        rng (random.Random): Source of randomness
+        sections (int): Number of headings
+        depth (int): Deepest heading level used (1-6)
+        blocks (int): Average content blocks under each heading
+        words (int): Average words per sentence
+
+    Returns:
+        str: The body HTML
+    """
+    parts = []
+    level = 1
+    for _ in range(sections):
+        # Walk up or down at most one level so the outline stays plausible.
+        level = max(1, min(depth, level + rng.choice((-1, 0, 1))))
+        parts.append(f"<h{level}>{_sentence(rng, 3).rstrip('.')}</h{level}>")
+        for _ in range(max(1, int(rng.gauss(blocks, 1)))):
+            parts.append(_block(rng, max(3, int(rng.gauss(words, words / 4)))))
+    return "".join(parts)
+
+
+def generate_pages(count, sections=8, depth=3, blocks=3, words=20, spaces=("ENG", "OPS", "HR"), seed=0,
+                   boilerplate=0.0):
+    """
+    Generate Confluence page objects with bodies, versions and spaces.
+
+    Args:
+        boilerplate (float): Share of pages that end with the same template section
+
+    Returns:
+        list: Page dicts shaped like the Confluence REST API returns them
+    """
+    rng = random.Random(seed)
+    return [
+        {
+            "id": str(100000 + i),
+            "title": f"{_sentence(rng, 4).rstrip('.')} ({i})",
+            "type": "page",
+            "space": {"key": spaces[i % len(spaces)]},
+            "version": {"number": 1, "when": "2025-08-01T10:00:00.000Z"},
+            "body": {"storage": {"value": generate_body(rng, sections, depth, blocks, words)
+                                           + (BOILERPLATE if rng.random() < boilerplate else "")}},
+        }
+        for i in range(count)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Confluence pages as JSON.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--sections", type=int, default=8, help="headings per page")
+    parser.add_argument("--depth", type=int, default=3, help="deepest heading level")
+    parser.add_argument("--blocks", type=int, default=3, help="content blocks per heading")
+    parser.add_argument("--words", type=int, default=20, help="words per sentence")
+    parser.add_argument("--boilerplate", type=float, default=0.0, help="share of pages with a shared template section")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(generate_pages(
+        args.pages, args.sections, args.depth, args.blocks, args.words, seed=args.seed, boilerplate=args.boilerplate,
+    )))
@@ -0,0 +1,60 @@
+import json
+import os
+from datetime import datetime, timezone
+
+from injest.embedder import CHROMA_PATH
+
+# Read by the backend's answer cache (ikb_backend/cache.py) to drop cached
+# answers that were generated from chunks this pipeline has since changed.
+CHANGES_PATH = os.path.join(CHROMA_PATH, "changes.jsonl")
+# Changes not yet visible to a backend serving snapshots; moved to the change
+# log once the snapshot containing them is published. Kept across an
+# interrupted run, whose resumption publishes them.
+PENDING_CHANGES_PATH = os.path.join(CHROMA_PATH, "changes.pending.jsonl")
+
+
+def record_changed_chunks(chunk_ids, path=CHANGES_PATH, snapshot=None):
+    """
+    Append the IDs of updated or removed chunks to the change log.
+
+    Args:
+        chunk_ids (iterable): IDs of chunks whose stored content changed
+        path (str): Location of the change log
+        snapshot (str): Snapshot that first contains the changes, if any; a
+            backend serving an older one holds the invalidation until it swaps
+    """
+    chunk_ids = sorted(chunk_ids)
+    if not chunk_ids:
+        return
+    record = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "ids": chunk_ids,
+    }
+    if snapshot is not None:
+        record["snapshot"] = snapshot
+    # A single write of one line keeps concurrent readers from seeing a
+    # half-written record.
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def publish_pending_changes(snapshot, path=CHANGES_PATH, pending_path=PENDING_CHANGES_PATH):
+    """
+    Move the changes staged in pending_path to the change log, once the
+    snapshot holding them has been published.
+
+    Args:
+        snapshot (str): Name of the published snapshot
+    """
+    if not os.path.exists(pending_path):
+        return
+    chunk_ids = set()
+    with open(pending_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                chunk_ids.update(json.loads(line)["ids"])
+            except (ValueError, KeyError):
+                # A line torn by a crash; its chunks were redone by the resumed run.
+                continue
+    record_changed_chunks(chunk_ids, path, snapshot)
+    os.remove(pending_path)
@@ -0,0 +1,69 @@
+import json
+import os
+
+from injest.embedder import CHROMA_PATH
+
+# Progress of the current run: a header line, then one line per group of
+# pages that has been fully embedded. Removed once the run completes.
+CHECKPOINT_PATH = os.path.join(CHROMA_PATH, "ingest_checkpoint.jsonl")
+
+
+def start_checkpoint(started_at, full, path=CHECKPOINT_PATH):
+    """
+    Begin a new checkpoint, discarding any previous one.
+
+    Args:
+        started_at (str): ISO timestamp the run started at; becomes the sync
+            watermark once the run (or its resumption) completes
+        full (bool): Whether the run crawls every page
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"started_at": started_at, "full": full}) + "\n")
+
+
+def record_pages(pages, path=CHECKPOINT_PATH):
+    """
+    Mark pages as fully embedded.
+
+    Only the pages of this step are appended, so the cost of a checkpoint
+    does not grow with the number of pages already done.
+
+    Args:
+        pages (dict): pageId -> {"version": int, "title": str}
+    """
+    if not pages:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"pages": pages}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_checkpoint(path=CHECKPOINT_PATH):
+    """
+    Load the checkpoint of an interrupted run, if there is one.
+
+    Returns:
+        dict or None: {"started_at": ISO timestamp, "full": bool,
+                       "pages": {pageId: {"version": int, "title": str}}}
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    try:
+        checkpoint = dict(json.loads(lines[0]), pages={})
+    except (IndexError, ValueError):
+        return None
+    for line in lines[1:]:
+        try:
+            checkpoint["pages"].update(json.loads(line)["pages"])
+        except (ValueError, KeyError):
+            # A line torn by the crash; those pages are simply redone.
+            continue
+    return checkpoint
+
+
+def clear_checkpoint(path=CHECKPOINT_PATH):
+    if os.path.exists(path):
+        os.remove(path)
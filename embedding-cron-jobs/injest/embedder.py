@@ -1,65 +1,348 @@
 
-import uuid
+import hashlib
+import json
+import os
+import re
 import chromadb
+import numpy as np
+from chromadb.utils import embedding_functions
+from injest.embedding_cache import EmbeddingCache
+from injest.lexical import LexicalIndex, index_text
+from injest.metrics import metrics
 
-client = chromadb.PersistentClient(path="../chroma_db")
-collection = client.get_or_create_collection(name="advantalabs")
+# The repository's chroma_db/, wherever the pipeline is started from.
+CHROMA_PATH = os.path.abspath(os.getenv("CHROMA_PATH", os.path.join(os.path.dirname(__file__), "../../chroma_db")))
+LEXICAL_INDEX_PATH = os.path.join(CHROMA_PATH, "lexical_index.sqlite3")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+EMBED_CACHE_PATH = os.path.join(CHROMA_PATH, "embedding_cache.sqlite3")
+# ~1.5 KB per entry at 384 dimensions.
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
 
+# "space" stores each Confluence space in a collection of its own
+# ("advantalabs-<space key>"), so a question scoped to a space only searches
+# that space; "none" keeps every chunk in the "advantalabs" collection.
+PARTITION_BY = os.getenv("PARTITION_BY", "space")
+COLLECTION_NAME = "advantalabs"
 
-def embed_documents(chunk):
-    # Check if a document with the same pageId and content exists
-    existing_docs = collection.query(
-        query_texts=[chunk["content"]],
-        n_results=5,
-        where={"$and": [
-            {"pageTitle": {"$eq": chunk["pageTitle"]}},
-            {"title": {"$eq": chunk["title"]}}
-        ]}
+client = chromadb.PersistentClient(path=CHROMA_PATH)
+# Documents are embedded here rather than by Chroma so embeddings can be
+# cached; the collections keep the function so queries use the same model.
+embedding_function = embedding_functions.DefaultEmbeddingFunction()
+# The unpartitioned collection; with PARTITION_BY=space it only holds chunks
+# stored before partitioning, until a full run moves them.
+collection = client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=embedding_function)
+lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+embedding_cache = EmbeddingCache(EMBED_CACHE_PATH) if EMBED_CACHE_ENABLED else None
+
+
+def partition_key(chunk):
+    """Partition a chunk is stored in; "" is the unpartitioned collection."""
+    return chunk.get("spaceKey", "") if PARTITION_BY == "space" else ""
+
+
+def partition_collection(partition):
+    """
+    Collection holding a partition, created on first use.
+
+    Args:
+        partition (str): Partition key (a space key), or "" for the
+            unpartitioned collection
+
+    Returns:
+        chromadb.Collection
+    """
+    if not partition:
+        return client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=embedding_function)
+    # Collection names only allow letters, digits, "_", "-" and "."; personal space keys start with "~".
+    name = f"{COLLECTION_NAME}-{re.sub(r'[^A-Za-z0-9_-]', '_', partition)}"
+    return client.get_or_create_collection(
+        name=name, embedding_function=embedding_function, metadata={"partition": partition}
+    )
+
+
+def all_collections():
+    """The unpartitioned collection and every partition, ordered by name."""
+    names = sorted(
+        c.name for c in client.list_collections()
+        if c.name == COLLECTION_NAME or c.name.startswith(COLLECTION_NAME + "-")
     )
-    
-    # Check if we found a match
-    should_add_new = True
-    if existing_docs and len(existing_docs['ids'][0]) > 0:
-        for i, doc_id in enumerate(existing_docs['ids'][0]):
-            # Check similarity of content to determine if it's the same document
-            metadata = existing_docs['metadatas'][0][i]
-            
-            # If we found a similar document, check if updated_at is different
-            if metadata.get("updated_at") != chunk["updated_at"]:
-                # Different updated_at timestamp - update the document
-                print(f"Updating document {doc_id} with new content from {chunk['pageTitle']} - {chunk['title']}")
-                collection.update(
-                    ids=[doc_id],
-                    documents=[chunk["content"]],
-                    metadatas=[{
-                        "title": chunk["title"],
-                        "id": doc_id,
-                        "content": chunk["content"],
-                        "pageTitle": chunk["pageTitle"],
-                        "updated_at": chunk["updated_at"]
-                    }]
+    return [client.get_collection(name, embedding_function=embedding_function) for name in names]
+
+
+def content_hash(chunk):
+    """
+    Hash of everything that goes into a chunk's embedding. Chunks whose hash
+    did not change are never re-embedded.
+    """
+    text = f"{chunk['title']}\n{chunk['content']}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embedding_model_key():
+    """
+    Identify the embedding model and its configuration; cached embeddings
+    made under any other key are stale.
+    """
+    return f"{embedding_function.name()}:{json.dumps(embedding_function.get_config(), sort_keys=True)}"
+
+
+def embed_documents(documents):
+    """
+    Embed documents, computing each distinct text once and reusing cached
+    embeddings of text seen before.
+
+    Args:
+        documents (list): Texts to embed
+
+    Returns:
+        list: One float32 numpy.ndarray per document, in order
+    """
+    hashes = [hashlib.sha256(document.encode("utf-8")).hexdigest() for document in documents]
+    model = embedding_model_key()
+    vectors = embedding_cache.get(set(hashes), model) if embedding_cache is not None else {}
+    hits = sum(digest in vectors for digest in hashes)
+
+    missing = {}
+    for digest, document in zip(hashes, documents):
+        if digest not in vectors:
+            missing.setdefault(digest, document)
+    if missing:
+        fresh = embedding_function(list(missing.values()))
+        fresh = {digest: np.asarray(vector, dtype=np.float32) for digest, vector in zip(missing, fresh)}
+        if embedding_cache is not None:
+            embedding_cache.put(list(fresh.items()), model)
+        vectors.update(fresh)
+
+    metrics.count("embed_cache_hits", hits)
+    metrics.count("embed_duplicates", len(documents) - hits - len(missing))
+    metrics.count("texts_embedded", len(missing))
+    return [vectors[digest] for digest in hashes]
+
+
+def prune_embedding_cache(max_entries=EMBED_CACHE_MAX_ENTRIES):
+    """
+    Evict cached embeddings of other models and the least recently used
+    beyond max_entries.
+
+    Returns:
+        int: Number of entries evicted
+    """
+    if embedding_cache is None:
+        return 0
+    return embedding_cache.prune(embedding_model_key(), max_entries)
+
+
+def chunk_metadata(chunk, digest):
+    # The chunk text is stored once, as the document; the record ID is the chunk ID.
+    return {
+        "title": chunk["title"],
+        "pageId": chunk["pageId"],
+        "pageTitle": chunk["pageTitle"],
+        "spaceKey": chunk.get("spaceKey", ""),
+        "chunkIndex": chunk["chunkIndex"],
+        "hash": digest,
+        "updated_at": chunk["updated_at"],
+    }
+
+
+def metadata_update(stored, metadata):
+    """
+    Chroma merges metadata on update and upsert; keys no longer written
+    (such as the content and id copies older runs stored) are removed by
+    setting them to None.
+    """
+    return dict(metadata, **{key: None for key in stored if key not in metadata})
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _by_collection(items):
+    """Group (collection, *fields) tuples per collection, for one Chroma call each."""
+    groups = {}
+    for collection_, *fields in items:
+        groups.setdefault(collection_.name, (collection_, []))[1].append(tuple(fields))
+    return groups.values()
+
+
+def _existing_metadata(page_ids, page_titles):
+    """
+    Fetch the metadata of every stored chunk belonging to the given pages,
+    with one bulk get per collection (a page may have moved to another
+    space). Chunks written before deterministic IDs existed have no pageId
+    and are matched by page title instead.
+
+    Returns:
+        dict: chunk ID -> (collection holding it, metadata)
+    """
+    where = {"pageId": {"$in": page_ids}}
+    if page_titles:
+        where = {"$or": [where, {"pageTitle": {"$in": page_titles}}]}
+    page_id_set = set(page_ids)
+    by_id = {}
+    for collection_ in all_collections():
+        with metrics.stage("chroma_lookup"):
+            existing = collection_.get(where=where, include=["metadatas"])
+        for doc_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            metadata = metadata or {}
+            page_id = metadata.get("pageId")
+            # A title match only counts for legacy chunks; another page may share the title.
+            if page_id in page_id_set or (page_id is None and metadata.get("pageTitle") in page_titles):
+                by_id[doc_id] = (collection_, metadata)
+    return by_id
+
+
+def embed_chunks(chunks, batch_size=EMBED_BATCH_SIZE):
+    """
+    Sync the chunks of one or more pages into their partitions.
+
+    The chunks passed in are treated as the complete, current set of chunks
+    for their pages: new and changed chunks are upserted, chunks whose content
+    hash is unchanged are skipped (their metadata is refreshed if needed, and
+    they are moved if their page now belongs to another partition), and
+    stored chunks of those pages that no longer exist are deleted.
+
+    Args:
+        chunks (list): Transformed chunks, all chunks of each page included
+        batch_size (int): Maximum number of records per Chroma call
+
+    Returns:
+        tuple: (stats dict with new/updated/unchanged/deleted/moved counts,
+                set of IDs whose stored content was replaced or removed)
+    """
+    stats = {"new": 0, "updated": 0, "unchanged": 0, "deleted": 0, "moved": 0}
+    touched_ids = set()
+    if not chunks:
+        return stats, touched_ids
+
+    batch_size = max(1, min(batch_size, client.get_max_batch_size()))
+    page_ids = sorted({chunk["pageId"] for chunk in chunks})
+    page_titles = sorted({chunk["pageTitle"] for chunk in chunks})
+    existing = _existing_metadata(page_ids, page_titles)
+    targets = {partition: partition_collection(partition) for partition in {partition_key(c) for c in chunks}}
+
+    upserts = []
+    metadata_updates = []
+    removals = []
+    relabelled = []
+    for chunk in chunks:
+        digest = content_hash(chunk)
+        metadata = chunk_metadata(chunk, digest)
+        target = targets[partition_key(chunk)]
+        stored_in, stored = existing.get(chunk["id"], (None, None))
+        moved = stored is not None and stored_in.name != target.name
+        if moved:
+            # A new record in the target collection: nothing to merge with.
+            removals.append((stored_in, chunk["id"]))
+            stats["moved"] += 1
+
+        if stored is None:
+            stats["new"] += 1
+            upserts.append((target, chunk["id"], chunk["content"], metadata))
+        elif stored.get("hash") != digest:
+            stats["updated"] += 1
+            touched_ids.add(chunk["id"])
+            upserts.append((target, chunk["id"], chunk["content"], metadata if moved else metadata_update(stored, metadata)))
+        else:
+            stats["unchanged"] += 1
+            if moved:
+                upserts.append((target, chunk["id"], chunk["content"], metadata))
+            elif stored != metadata:
+                # Same text, e.g. only the page version changed: no re-embedding needed.
+                metadata_updates.append((target, chunk["id"], metadata_update(stored, metadata)))
+                if stored.get("spaceKey") != metadata["spaceKey"]:
+                    relabelled.append((chunk["id"], index_text(metadata["title"], chunk["content"]), metadata["spaceKey"]))
+
+    incoming_ids = {chunk["id"] for chunk in chunks}
+    stale = [(stored_in, doc_id) for doc_id, (stored_in, _) in existing.items() if doc_id not in incoming_ids]
+    stats["deleted"] = len(stale)
+    touched_ids.update(doc_id for _, doc_id in stale)
+
+    for collection_, items in _by_collection(upserts):
+        for batch in _batches(items, batch_size):
+            ids, documents, metadatas = zip(*batch)
+            print(f"Upserting {len(ids)} chunks")
+            with metrics.stage("embed"):
+                embeddings = embed_documents(list(documents))
+            with metrics.stage("upsert"):
+                collection_.upsert(
+                    ids=list(ids), embeddings=embeddings, documents=list(documents), metadatas=list(metadatas)
                 )
-                should_add_new = False
-                return collection.get(ids=[doc_id])
-            else:
-                # Same updated_at - no need to update
-                print(f"Document {doc_id} is already up to date - {chunk['pageTitle']} - {chunk['title']}")
-                should_add_new = False
-                return collection.get(ids=[doc_id])
-    
-    # If no match found or all matches had different content, add as new document
-    if should_add_new:
-        random_id = str(uuid.uuid4())
-        print(f"Adding new document {random_id} for {chunk['pageTitle']} - {chunk['title']}")
-        collection.add(
-            ids=[random_id],                     
-            documents=[chunk["content"]],       
-            metadatas=[{
-                "title": chunk["title"], 
-                "id": random_id,                 
-                "content": chunk["content"], 
-                "pageTitle": chunk["pageTitle"],
-                "updated_at": chunk["updated_at"]
-            }]
-        )
-        return collection.get(ids=[random_id])
+            with metrics.stage("lexical_index"):
+                lexical_index.upsert([
+                    (doc_id, index_text(metadata["title"], document), metadata["spaceKey"])
+                    for doc_id, document, metadata in batch
+                ])
+
+    for collection_, items in _by_collection(metadata_updates):
+        for batch in _batches(items, batch_size):
+            ids, metadatas = zip(*batch)
+            with metrics.stage("metadata_update"):
+                collection_.update(ids=list(ids), metadatas=list(metadatas))
+    with metrics.stage("lexical_index"):
+        lexical_index.upsert(relabelled)
+
+    for collection_, items in _by_collection(stale + removals):
+        for batch in _batches([doc_id for (doc_id,) in items], batch_size):
+            print(f"Deleting {len(batch)} chunks from {collection_.name}")
+            with metrics.stage("delete"):
+                collection_.delete(ids=batch)
+    with metrics.stage("delete"):
+        # Moved chunks were re-indexed under their new partition above.
+        lexical_index.delete([doc_id for _, doc_id in stale])
+
+    return stats, touched_ids
+
+
+def delete_pages(page_ids, page_titles=()):
+    """
+    Remove every stored chunk of the given pages, e.g. pages deleted in
+    Confluence or pages that no longer produce any chunks.
+
+    Args:
+        page_ids (list): Confluence page IDs
+        page_titles (list): Titles of those pages, to catch legacy chunks
+            stored without a pageId
+
+    Returns:
+        set: IDs of the deleted chunks
+    """
+    page_ids = sorted(page_ids)
+    if not page_ids:
+        return set()
+
+    existing = _existing_metadata(page_ids, sorted(page_titles))
+    batch_size = max(1, min(EMBED_BATCH_SIZE, client.get_max_batch_size()))
+    for collection_, items in _by_collection((stored_in, doc_id) for doc_id, (stored_in, _) in existing.items()):
+        for batch in _batches([doc_id for (doc_id,) in items], batch_size):
+            with metrics.stage("delete"):
+                collection_.delete(ids=batch)
+                lexical_index.delete(batch)
+    return set(existing)
+
+
+def backfill_lexical_index(batch_size=EMBED_BATCH_SIZE):
+    """
+    Build the keyword index from the collection when it is empty, e.g. the
+    first run after hybrid retrieval was introduced. Later runs keep it in
+    step through embed_chunks and delete_pages.
+
+    Returns:
+        int: Number of documents indexed
+    """
+    if lexical_index.doc_count() > 0:
+        return 0
+    total = 0
+    for collection_ in all_collections():
+        count = collection_.count()
+        for offset in range(0, count, batch_size):
+            records = collection_.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+            lexical_index.upsert([
+                (doc_id, index_text((metadata or {}).get("title", ""), document or ""), (metadata or {}).get("spaceKey", ""))
+                for doc_id, document, metadata in zip(records["ids"], records["documents"], records["metadatas"])
+            ])
+        total += count
+    return total
@@ -0,0 +1,99 @@
+import sqlite3
+import time
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    On-disk (SQLite) cache of embeddings keyed by the hash of the embedded
+    text and the embedding model, so identical text (page templates, shared
+    warnings, a rebuilt collection) is only ever embedded once per model.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (hash, model)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+        """)
+
+    def get(self, hashes, model):
+        """
+        Look up embeddings and mark the hits as recently used.
+
+        Args:
+            hashes (list): Text hashes
+            model (str): Embedding model name
+
+        Returns:
+            dict: hash -> numpy.ndarray (float32) for every hash found
+        """
+        found = {}
+        hashes = list(hashes)
+        # Stay below SQLite's limit on bound parameters.
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                [model, *batch],
+            ).fetchall()
+            found.update((digest, np.frombuffer(vector, dtype=np.float32)) for digest, vector in rows)
+        if found:
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE hash = ? AND model = ?",
+                    [(now, digest, model) for digest in found],
+                )
+        return found
+
+    def put(self, items, model):
+        """
+        Store embeddings.
+
+        Args:
+            items (list): (hash, embedding) pairs
+            model (str): Embedding model name
+        """
+        if not items:
+            return
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                [(digest, model, np.asarray(vector, dtype=np.float32).tobytes(), now) for digest, vector in items],
+            )
+
+    def prune(self, model, max_entries):
+        """
+        Drop embeddings of every other model, then the least recently used
+        ones beyond max_entries.
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self.conn:
+            removed = self.conn.execute("DELETE FROM embeddings WHERE model != ?", (model,)).rowcount
+            excess = self.entry_count() - max_entries
+            if excess > 0:
+                removed += self.conn.execute(
+                    "DELETE FROM embeddings WHERE (hash, model) IN "
+                    "(SELECT hash, model FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                ).rowcount
+        return removed
+
+    def entry_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
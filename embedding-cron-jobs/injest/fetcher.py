@@ -1,24 +1,248 @@
 
 import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
 import requests
+from injest.metrics import metrics
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+CONFLUENCE_BASE_URL = os.getenv("CONFLUENCE_BASE_URL", "https://advantalabs.atlassian.net/wiki").rstrip("/")
+CONFLUENCE_PAGE_LIMIT = int(os.getenv("CONFLUENCE_PAGE_LIMIT", "50"))
+CONFLUENCE_MAX_WORKERS = int(os.getenv("CONFLUENCE_MAX_WORKERS", "8"))
+CONFLUENCE_MAX_RETRIES = int(os.getenv("CONFLUENCE_MAX_RETRIES", "5"))
+CONFLUENCE_BACKOFF_SECONDS = float(os.getenv("CONFLUENCE_BACKOFF_SECONDS", "1"))
+CONFLUENCE_TIMEOUT_SECONDS = float(os.getenv("CONFLUENCE_TIMEOUT_SECONDS", "30"))
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY_SECONDS = 60
 
-def fetch_confluence_pages():
+_session = None
+_session_lock = threading.Lock()
 
-    url = "https://advantalabs.atlassian.net/wiki/rest/api/content?type=page&expand=body.storage,version"
 
+def _get_auth():
     confluence_user = os.getenv("CONFLUENCE_USER")
     confluence_token = os.getenv("CONFLUENCE_TOKEN")
     if not confluence_user or not confluence_token:
         raise ValueError("CONFLUENCE_USER and CONFLUENCE_TOKEN must be set in environment variables.")
-    auth = HTTPBasicAuth(confluence_user, confluence_token)
+    return HTTPBasicAuth(confluence_user, confluence_token)
+
+
+def get_session():
+    """
+    Shared requests session with a connection pool large enough for every
+    body-fetching worker to keep its own connection alive.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.auth = _get_auth()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(CONFLUENCE_MAX_WORKERS, 1))
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before retrying: Retry-After if the server sent one, else exponential backoff."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), MAX_RETRY_DELAY_SECONDS)
+
+    delay = CONFLUENCE_BACKOFF_SECONDS * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), MAX_RETRY_DELAY_SECONDS)
+
+
+def _get_json(url, params=None):
+    session = get_session()
+    for attempt in range(CONFLUENCE_MAX_RETRIES + 1):
+        metrics.count("http_requests")
+        if attempt:
+            metrics.count("http_retries")
+        try:
+            response = session.get(url, params=params, timeout=CONFLUENCE_TIMEOUT_SECONDS)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == CONFLUENCE_MAX_RETRIES:
+                raise
+            delay = _retry_delay(None, attempt)
+            print(f"Request to {url} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code in RETRY_STATUSES and attempt < CONFLUENCE_MAX_RETRIES:
+            delay = _retry_delay(response, attempt)
+            print(f"Confluence returned {response.status_code} for {url}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response.json()
+
+
+def _paginate(path, params):
+    """
+    Yield every result of a paginated Confluence REST listing, following
+    _links.next until the last page.
+    """
+    url = f"{CONFLUENCE_BASE_URL}{path}"
+    params = dict(params, limit=CONFLUENCE_PAGE_LIMIT)
+
+    while url:
+        data = _get_json(url, params)
+        yield from data.get("results", [])
+
+        next_link = data.get("_links", {}).get("next")
+        if not next_link:
+            break
+        # next already carries the query string, including start
+        url = f"{data['_links'].get('base', CONFLUENCE_BASE_URL)}{next_link}"
+        params = None
+
+
+def iter_spaces():
+    """Yield the key of every space visible to the configured user."""
+    for space in _paginate("/rest/api/space", {}):
+        yield space["key"]
+
+
+def iter_page_summaries():
+    """
+    Walk every space and yield its pages without bodies.
+
+    Yields:
+        dict: Page objects with id, title, version and space
+    """
+    for space_key in iter_spaces():
+        yield from _paginate(
+            "/rest/api/content",
+            {"spaceKey": space_key, "type": "page", "expand": "version,space"},
+        )
+
+
+def iter_pages_by_id(page_ids, max_workers=CONFLUENCE_MAX_WORKERS, gone=None):
+    """
+    Fetch page bodies concurrently, yielding each page as soon as it arrives.
+
+    page_ids may be a lazy iterable; at most a couple of requests per worker
+    are in flight, so a long crawl never queues up the whole wiki. Pages
+    deleted after they were listed are skipped.
+
+    Args:
+        page_ids (iterable): Confluence page IDs
+        max_workers (int): Maximum number of concurrent body requests
+        gone (set): Receives the IDs of skipped pages, if given
+
+    Yields:
+        dict: Confluence page objects with body.storage and version
+    """
+    max_workers = max(max_workers, 1)
+    page_ids = iter(page_ids)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="confluence") as executor:
+        pending = set()
+        page_id_of = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_workers * 2:
+                page_id = next(page_ids, None)
+                if page_id is None:
+                    exhausted = True
+                    break
+                future = executor.submit(fetch_page, page_id)
+                page_id_of[future] = page_id
+                pending.add(future)
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page_id = page_id_of.pop(future)
+                page = future.result()
+                if page is None:
+                    metrics.count("pages_gone")
+                    if gone is not None:
+                        gone.add(page_id)
+                    continue
+                yield page
+
+
+def iter_confluence_pages(max_workers=CONFLUENCE_MAX_WORKERS):
+    """
+    Crawl every page of every space, bodies included, as a generator so
+    downstream stages can start before the crawl finishes.
+
+    Yields:
+        dict: Confluence page objects with body.storage, version and space
+    """
+    page_ids = (page["id"] for page in iter_page_summaries())
+    yield from iter_pages_by_id(page_ids, max_workers=max_workers)
+
+
+def fetch_confluence_pages():
+    """
+    Fetch every page with its storage-format body and version.
+
+    Returns:
+        list: Confluence page objects
+    """
+    return list(iter_confluence_pages())
+
+
+def list_page_versions():
+    """
+    List every page that currently exists, without bodies.
+
+    Returns:
+        dict: pageId -> version number
+    """
+    return {page["id"]: page.get("version", {}).get("number") for page in iter_page_summaries()}
+
+
+def fetch_modified_pages(since):
+    """
+    Find pages modified at or after a point in time using CQL, without bodies.
+
+    Args:
+        since (datetime): Lower bound for lastmodified
+
+    Returns:
+        list: Page objects with id, title and version
+    """
+    cql = f'type = page AND lastmodified >= "{since.strftime("%Y/%m/%d %H:%M")}"'
+    return list(_paginate("/rest/api/content/search", {"cql": cql, "expand": "version,space"}))
 
-    response = requests.get(url, auth=auth).json()
 
-    transformed_response = response.get("results", [])
+def fetch_page(page_id):
+    """
+    Fetch a single page with its storage-format body and version.
 
+    Args:
+        page_id (str): Confluence page ID
 
-    return transformed_response
-          
\ No newline at end of file
+    Returns:
+        dict: The Confluence page object, or None if the page no longer exists
+    """
+    try:
+        return _get_json(
+            f"{CONFLUENCE_BASE_URL}/rest/api/content/{page_id}",
+            {"expand": "body.storage,version,space"},
+        )
+    except requests.HTTPError as e:
+        # Deleted between being listed and being fetched; expected on a live wiki.
+        if e.response is not None and e.response.status_code == 404:
+            print(f"Page {page_id} no longer exists; skipping it.")
+            return None
+        raise
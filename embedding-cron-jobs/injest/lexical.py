@@ -0,0 +1,118 @@
+import re
+import sqlite3
+from collections import Counter
+
+# Keep in sync with ikb_backend/lexical.py, which tokenizes queries the same way.
+_TOKEN = re.compile(r"[a-z0-9_]+(?:[.\-/:][a-z0-9_]+)*")
+_SEPARATORS = re.compile(r"[._\-/:]")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it of on or that the "
+    "this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Lower-cased terms for BM25. Identifiers such as DATABASE_URL, ERR-1042 or
+    payments.api are kept whole and also indexed by their parts.
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if _SEPARATORS.search(token):
+            terms.extend(part for part in _SEPARATORS.split(token) if part and part not in STOPWORDS)
+    return terms
+
+
+class LexicalIndex:
+    """
+    On-disk BM25 inverted index (SQLite) kept next to the Chroma collection.
+    The backend opens the same file read-only to run keyword queries.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS docs (
+                id TEXT PRIMARY KEY,
+                length INTEGER NOT NULL,
+                partition TEXT
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO stats VALUES ('doc_count', 0), ('total_length', 0);
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(docs)")}
+        if "partition" not in columns:
+            # Indexes written before partitioning; those documents have no partition until re-indexed.
+            self.conn.execute("ALTER TABLE docs ADD COLUMN partition TEXT")
+
+    def doc_count(self):
+        return self.conn.execute("SELECT value FROM stats WHERE key = 'doc_count'").fetchone()[0]
+
+    def upsert(self, docs):
+        """
+        Index or re-index documents.
+
+        Args:
+            docs (list): (chunk id, text, partition) tuples; the partition
+                (space key) lets searches be scoped
+        """
+        if not docs:
+            return
+        with self.conn:
+            self._delete([doc_id for doc_id, _, _ in docs])
+            total = 0
+            for doc_id, text, partition in docs:
+                terms = tokenize(text)
+                total += len(terms)
+                self.conn.execute("INSERT INTO docs VALUES (?, ?, ?)", (doc_id, len(terms), partition))
+                self.conn.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    [(term, doc_id, tf) for term, tf in Counter(terms).items()],
+                )
+            self._bump_stats(len(docs), total)
+
+    def delete(self, doc_ids):
+        """Remove documents from the index."""
+        if not doc_ids:
+            return
+        with self.conn:
+            self._delete(list(doc_ids))
+
+    def _delete(self, doc_ids):
+        removed = 0
+        removed_length = 0
+        for doc_id in doc_ids:
+            row = self.conn.execute("SELECT length FROM docs WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                continue
+            self.conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+            self.conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+            removed += 1
+            removed_length += row[0]
+        self._bump_stats(-removed, -removed_length)
+
+    def _bump_stats(self, docs, length):
+        self.conn.execute("UPDATE stats SET value = value + ? WHERE key = 'doc_count'", (docs,))
+        self.conn.execute("UPDATE stats SET value = value + ? WHERE key = 'total_length'", (length,))
+
+    def close(self):
+        self.conn.close()
+
+
+def index_text(title, content):
+    return f"{title}\n{content}"
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StageMetrics:
+    """
+    Durations and counters for one pipeline run, printed at the end and
+    written in Prometheus text format so the backend's /metrics can serve
+    them (the ingest job itself is too short-lived to be scraped).
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+        # The fetcher counts requests from its worker threads.
+        self._lock = threading.Lock()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block; repeated blocks of the same stage add up."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, stage, iterable):
+        """
+        Yield from iterable, recording only the time spent waiting for each
+        item, e.g. how long a streaming consumer waited on Confluence.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage, time.perf_counter() - start)
+                return
+            self.add_time(stage, time.perf_counter() - start)
+            yield item
+
+    def summary(self):
+        lines = ["Stage durations:"]
+        lines += [f"  {stage:<18} {seconds:9.3f} s" for stage, seconds in self.durations.items()]
+        lines.append("Counters:")
+        lines += [f"  {name:<18} {value:9d}" for name, value in sorted(self.counts.items())]
+        return "\n".join(lines)
+
+    def write_prometheus(self, path):
+        """Atomically write the metrics of this run as Prometheus gauges."""
+        lines = [
+            "# HELP ikb_ingest_stage_seconds Duration of each stage of the last ingest run.",
+            "# TYPE ikb_ingest_stage_seconds gauge",
+        ]
+        lines += [f'ikb_ingest_stage_seconds{{stage="{stage}"}} {seconds}' for stage, seconds in self.durations.items()]
+        lines += [
+            "# HELP ikb_ingest_items Items processed by the last ingest run.",
+            "# TYPE ikb_ingest_items gauge",
+        ]
+        lines += [f'ikb_ingest_items{{kind="{name}"}} {value}' for name, value in sorted(self.counts.items())]
+        lines += [
+            "# HELP ikb_ingest_last_run_timestamp_seconds When the last ingest run finished.",
+            "# TYPE ikb_ingest_last_run_timestamp_seconds gauge",
+            f"ikb_ingest_last_run_timestamp_seconds {time.time()}",
+        ]
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+
+metrics = StageMetrics()
@@ -0,0 +1,145 @@
+"""
+Rewrite the collections into the compact storage layout, in place.
+
+Older runs stored each chunk's text twice (as the document and again as
+"content" in the metadata) plus a copy of the record ID. This drops those
+metadata keys batch by batch while the backend keeps serving, republishes
+the vector snapshot, then optionally vacuums the SQLite files so the freed
+pages go back to the disk.
+
+    python -m injest.migrate
+    python -m injest.migrate --vacuum     # briefly locks the database; run while ingest is idle
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from injest.embedder import (
+    CHROMA_PATH,
+    EMBED_BATCH_SIZE,
+    EMBED_CACHE_PATH,
+    LEXICAL_INDEX_PATH,
+    all_collections,
+    metadata_update,
+)
+from injest.snapshot import current_snapshot, publish_snapshot
+
+# Metadata keys written by current runs (see embedder.chunk_metadata).
+METADATA_KEYS = ("title", "pageId", "pageTitle", "spaceKey", "chunkIndex", "hash", "updated_at")
+
+
+def compact_metadata(batch_size=EMBED_BATCH_SIZE):
+    """
+    Remove every metadata key the current layout no longer writes.
+
+    Args:
+        batch_size (int): Records read and updated per Chroma call
+
+    Returns:
+        int: Number of records rewritten
+    """
+    rewritten = 0
+    for collection in all_collections():
+        for offset in range(0, collection.count(), batch_size):
+            # Updates leave the order unchanged, so offsets stay valid while rewriting.
+            records = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+            updates = []
+            for doc_id, metadata in zip(records["ids"], records["metadatas"]):
+                metadata = metadata or {}
+                if any(key not in METADATA_KEYS for key in metadata):
+                    slim = {key: value for key, value in metadata.items() if key in METADATA_KEYS}
+                    updates.append((doc_id, metadata_update(metadata, slim)))
+            if updates:
+                ids, metadatas = zip(*updates)
+                collection.update(ids=list(ids), metadatas=list(metadatas))
+                rewritten += len(updates)
+    return rewritten
+
+
+def vacuum(paths):
+    """
+    Rebuild SQLite files to release the space of deleted data.
+
+    Returns:
+        dict: path -> bytes reclaimed
+    """
+    reclaimed = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        before = os.path.getsize(path)
+        conn = sqlite3.connect(path, timeout=60)
+        try:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        reclaimed[path] = before - os.path.getsize(path)
+    return reclaimed
+
+
+CHROMA_DB_FILE = os.path.join(CHROMA_PATH, "chroma.sqlite3")
+
+
+def storage_report():
+    """Size of Chroma's SQLite file (documents and metadata) and of the whole directory."""
+    total = sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(CHROMA_PATH)
+        for name in names
+    )
+    return f"chroma.sqlite3 {os.path.getsize(CHROMA_DB_FILE) / 1e6:.1f} MB, {total / 1e6:.1f} MB in total"
+
+
+def query_latency_ms(samples=200, n_results=6):
+    """
+    Median latency of queries shaped like the backend's (documents and
+    metadata included) against the largest collection, using stored
+    embeddings as query vectors.
+    """
+    # A fresh store may not have any collection yet.
+    collection = max(all_collections(), key=lambda c: c.count(), default=None)
+    count = collection.count() if collection is not None else 0
+    if not count:
+        return 0.0
+    rng = np.random.default_rng(0)
+    offsets = rng.integers(0, count, size=min(samples, count))
+    queries = [
+        collection.get(limit=1, offset=int(offset), include=["embeddings"])["embeddings"][0]
+        for offset in offsets
+    ]
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[query], n_results=n_results, include=["documents", "metadatas", "distances"])
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate the collection to the compact storage layout.")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--vacuum", action="store_true", help="compact the SQLite files afterwards")
+    args = parser.parse_args()
+
+    print(f"Before: {storage_report()}, median query {query_latency_ms():.2f} ms")
+
+    start = time.time()
+    rewritten = compact_metadata(args.batch_size)
+    total = sum(collection.count() for collection in all_collections())
+    print(f"Rewrote the metadata of {rewritten} of {total} chunks in {time.time() - start:.1f} s.")
+    if rewritten and current_snapshot() is not None:
+        # The snapshot carries its own copy of the metadata.
+        print(f"Published snapshot {publish_snapshot()}.")
+
+    if args.vacuum:
+        for path, freed in vacuum([
+            CHROMA_DB_FILE, LEXICAL_INDEX_PATH, EMBED_CACHE_PATH,
+        ]).items():
+            print(f"Vacuumed {os.path.basename(path)}: {freed / 1e6:.1f} MB reclaimed")
+
+    print(f"After:  {storage_report()}, median query {query_latency_ms():.2f} ms")
@@ -1,50 +1,210 @@
-
-from injest.embedder import embed_documents
-from injest.fetcher import fetch_confluence_pages
-from injest.transformer import transform_fetched_pages
+from injest.changes import CHANGES_PATH, PENDING_CHANGES_PATH, publish_pending_changes, record_changed_chunks
+from injest.checkpoint import clear_checkpoint, load_checkpoint, record_pages, start_checkpoint
+from injest.embedder import (
+    CHROMA_PATH,
+    backfill_lexical_index,
+    embed_chunks,
+    delete_pages,
+    embedding_cache,
+    prune_embedding_cache,
+)
+from injest.fetcher import iter_page_summaries, iter_pages_by_id, fetch_modified_pages, list_page_versions
+from injest.metrics import metrics
+from injest.snapshot import SNAPSHOT_ENABLED, current_snapshot, publish_snapshot
+from injest.stages import run_stage
+from injest.sync_state import (
+    SYNC_OVERLAP_MINUTES,
+    load_sync_state,
+    save_sync_state,
+    version_number,
+    watermark_datetime,
+)
+from injest.transformer import iter_transformed_pages
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+import argparse
+import os
 import time
 
 load_dotenv()
 
+# Served by the backend's /metrics endpoint.
+INGEST_METRICS_PATH = os.path.join(CHROMA_PATH, "ingest_metrics.prom")
+# Chunks embedded and checkpointed together; pages are never split across groups.
+PIPELINE_GROUP_CHUNKS = int(os.getenv("PIPELINE_GROUP_CHUNKS", "256"))
+# The backend serves the snapshot published at the end of the run, so cached
+# answers are only invalidated once that snapshot is current; otherwise a
+# question asked during the run would cache the old content again.
+CHANGES_LOG = PENDING_CHANGES_PATH if SNAPSHOT_ENABLED else CHANGES_PATH
+
+parser = argparse.ArgumentParser(description="Sync Confluence pages into the vector store.")
+parser.add_argument("--full", action="store_true",
+                    help="re-fetch every page instead of only pages modified since the last run")
+parser.add_argument("--restart", action="store_true",
+                    help="ignore the checkpoint of an interrupted run instead of resuming it")
+args = parser.parse_args()
+
 print("Starting document embedding pipeline...")
 start_time = time.time()
 
-print("Fetching pages from Confluence...")
-fetched_pages = fetch_confluence_pages()
-print(f"Fetched {len(fetched_pages)} pages from Confluence.")
-
-print("Transforming pages into chunks...")
-transformed_chunks = transform_fetched_pages(fetched_pages)
-print(f"Created {len(transformed_chunks)} chunks for embedding.")
-
-print("Starting embedding process...")
-new_count = 0
-updated_count = 0
-unchanged_count = 0
-
-for i, chunk in enumerate(transformed_chunks):
-    print(f"Processing chunk {i+1}/{len(transformed_chunks)}: {chunk['title']}")
-    
-    # Track state before embedding
-    initial_doc_state = {"new": True}
-    
-    # Process embedding and get result
-    embeddings = embed_documents(chunk)
-
-    
-    
-    # Count based on console output (a bit hacky but works)
-    if "Adding new document" in str(embeddings):
-        new_count += 1
-    elif "Updating document" in str(embeddings):
-        updated_count += 1
-    else:
-        unchanged_count += 1
+with metrics.stage("lexical_backfill"):
+    backfilled = backfill_lexical_index()
+if backfilled:
+    print(f"Built keyword index for {backfilled} existing chunks.")
 
-elapsed_time = time.time() - start_time
-print(f"\nEmbedding pipeline completed in {elapsed_time:.2f} seconds.")
-print(f"Summary: {new_count} new documents, {updated_count} updated documents, {unchanged_count} unchanged documents.")
-print(f"Total chunks processed: {len(transformed_chunks)}")
+state = load_sync_state()
+watermark = watermark_datetime(state)
+
+checkpoint = None if args.restart else load_checkpoint()
+if checkpoint is not None:
+    # Same mode and start time as the interrupted run, so its watermark
+    # still covers everything that changed since.
+    full = checkpoint["full"]
+    run_started_at = datetime.fromisoformat(checkpoint["started_at"])
+    print(f"Resuming the run started {run_started_at:%Y-%m-%d %H:%M} UTC; "
+          f"{len(checkpoint['pages'])} pages are already done.")
+else:
+    full = args.full or watermark is None
+    run_started_at = datetime.now(timezone.utc)
+    checkpoint = {"started_at": run_started_at.isoformat(), "full": full, "pages": {}}
+    start_checkpoint(checkpoint["started_at"], full)
+done_pages = checkpoint["pages"]
+resumed = bool(done_pages)
+
+
+def pending(pages):
+    """Skip pages the interrupted run already embedded at the same version."""
+    for page in pages:
+        done = done_pages.get(page["id"])
+        if done is not None and done["version"] == version_number(page):
+            metrics.count("pages_resumed")
+            continue
+        yield page
+
+
+if full:
+    print("Fetching all pages from Confluence...")
+    current_versions = {}
+
+    def listed(pages):
+        for page in pages:
+            current_versions[page["id"]] = version_number(page)
+            yield page
+
+    page_ids = (page["id"] for page in pending(listed(iter_page_summaries())))
+else:
+    since = watermark - timedelta(minutes=SYNC_OVERLAP_MINUTES)
+    print(f"Fetching pages modified since {since:%Y-%m-%d %H:%M} UTC...")
+    with metrics.stage("list_changes"):
+        candidates = fetch_modified_pages(since)
+    changed = [
+        page for page in candidates
+        if state["pages"].get(page["id"], {}).get("version") != version_number(page)
+    ]
+    print(f"{len(candidates)} recently modified pages, {len(changed)} with a new version.")
+    page_ids = [page["id"] for page in pending(changed)]
+    with metrics.stage("list_changes"):
+        current_versions = list_page_versions()
+
+
+def page_entries(transformed):
+    # Bodies are dropped here; only what the sync state needs travels on.
+    for page, chunks in transformed:
+        yield {"id": page["id"], "title": page["title"], "version": version_number(page)}, chunks
 
 
+# fetch -> transform -> embed run concurrently, connected by bounded queues,
+# so only a few pages per stage are in memory at any time. "fetch_wait" is
+# the fetch stage waiting on Confluence, "transform_wait" the embed stage
+# waiting for chunks.
+# Pages deleted after they were listed; pruned below like any other deleted page.
+gone_page_ids = set()
+page_stream = run_stage(metrics.timed_iter("fetch_wait", iter_pages_by_id(page_ids, gone=gone_page_ids)), "fetch")
+transformed = run_stage(page_entries(iter_transformed_pages(page_stream)), "transform")
+
+totals = {"new": 0, "updated": 0, "unchanged": 0, "deleted": 0, "moved": 0}
+changed_collection = False
+group, group_chunks = [], []
+
+
+def flush_group():
+    """Embed one group of pages, prune the empty ones, then checkpoint them."""
+    global changed_collection
+    with metrics.stage("embed_sync"):
+        stats, touched_ids = embed_chunks(group_chunks)
+    for kind, value in stats.items():
+        totals[kind] += value
+
+    # Pages that no longer contain any chunkable content must not keep
+    # answering questions.
+    empty_pages = [page for page, chunks in group if not chunks]
+    with metrics.stage("prune"):
+        touched_ids |= delete_pages(
+            [page["id"] for page in empty_pages],
+            [page["title"] for page in empty_pages if page["title"]],
+        )
+    record_changed_chunks(touched_ids, CHANGES_LOG)
+    changed_collection = changed_collection or bool(stats["new"] or stats["moved"] or touched_ids)
+
+    finished = {page["id"]: {"version": page["version"], "title": page["title"]} for page, _ in group}
+    record_pages(finished)
+    done_pages.update(finished)
+    metrics.count("pages_fetched", len(group))
+    metrics.count("chunks", len(group_chunks))
+    group.clear()
+    group_chunks.clear()
+
+
+print("Fetching, transforming and embedding pages...")
+for page, chunks in metrics.timed_iter("transform_wait", transformed):
+    group.append((page, chunks))
+    group_chunks.extend(chunks)
+    if len(group_chunks) >= PIPELINE_GROUP_CHUNKS:
+        flush_group()
+if group:
+    flush_group()
+for kind, value in totals.items():
+    metrics.count(f"chunks_{kind}", value)
+print(f"Processed {metrics.counts.get('pages_fetched', 0)} pages "
+      f"({metrics.counts.get('chunks', 0)} chunks) from Confluence.")
+
+# Pages that vanished from Confluence must not keep answering questions.
+for page_id in gone_page_ids:
+    current_versions.pop(page_id, None)
+deleted_page_ids = [page_id for page_id in state["pages"] if page_id not in current_versions]
+prune_titles = [state["pages"][page_id].get("title", "") for page_id in deleted_page_ids]
+with metrics.stage("prune"):
+    pruned_ids = delete_pages(deleted_page_ids, [title for title in prune_titles if title])
+metrics.count("pages_deleted", len(deleted_page_ids))
+metrics.count("chunks_pruned", len(pruned_ids))
+if deleted_page_ids:
+    print(f"Pruned {len(deleted_page_ids)} deleted pages from the index.")
+record_changed_chunks(pruned_ids, CHANGES_LOG)
+
+metrics.count("embed_cache_evicted", prune_embedding_cache())
+if embedding_cache is not None:
+    print(f"Embedding cache: {metrics.counts.get('embed_cache_hits', 0)} hits, "
+          f"{metrics.counts.get('texts_embedded', 0)} texts embedded, {embedding_cache.entry_count()} entries.")
+
+# A resumed run also publishes what the interrupted run had already written.
+if SNAPSHOT_ENABLED and (changed_collection or pruned_ids or resumed or current_snapshot() is None):
+    print("Publishing vector snapshot...")
+    with metrics.stage("snapshot"):
+        name = publish_snapshot()
+    print(f"Published snapshot {name}.")
+    publish_pending_changes(name)
+
+state["pages"].update(done_pages)
+for page_id in deleted_page_ids:
+    del state["pages"][page_id]
+state["watermark"] = run_started_at.isoformat()
+save_sync_state(state)
+clear_checkpoint()
+
+elapsed_time = time.time() - start_time
+metrics.add_time("total", elapsed_time)
+metrics.write_prometheus(INGEST_METRICS_PATH)
+print(f"\nEmbedding pipeline completed in {elapsed_time:.2f} seconds.")
+print(f"Summary: {totals['new']} new documents, {totals['updated']} updated documents, {totals['unchanged']} unchanged documents, {totals['deleted'] + len(pruned_ids)} removed documents, {totals['moved']} moved to another space.")
+print(f"Total chunks processed: {metrics.counts.get('chunks', 0)}")
+print(metrics.summary())
@@ -0,0 +1,138 @@
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime, timezone
+
+import numpy as np
+
+from injest.embedder import CHROMA_PATH, EMBED_BATCH_SIZE, LEXICAL_INDEX_PATH, all_collections
+
+# Read by the backend's in-memory vector engine (ikb_backend/vector_index.py).
+SNAPSHOT_ROOT = os.path.join(CHROMA_PATH, "snapshots")
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "1") == "1"
+SNAPSHOT_DTYPE = os.getenv("SNAPSHOT_DTYPE", "float32")
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "2"))
+
+CURRENT_FILE = "CURRENT"
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json"
+LEXICAL_FILE = "lexical_index.sqlite3"
+# Versions are built under this prefix and renamed once complete.
+BUILD_PREFIX = ".build-"
+
+
+def current_snapshot(root=SNAPSHOT_ROOT):
+    """Name of the published snapshot, or None if none has been published."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_snapshot(collections=None, root=SNAPSHOT_ROOT, dtype=SNAPSHOT_DTYPE, batch_size=EMBED_BATCH_SIZE):
+    """
+    Publish a new immutable index version: every embedding of the
+    collections as a contiguous, L2-normalised matrix, the matching IDs,
+    documents and metadata, and a copy of the keyword index. Each space's
+    row ranges are recorded, so a scoped search only scans the rows of its
+    spaces; with one collection per space every space is a single range.
+
+    The export is streamed a batch at a time into a memory-mapped matrix and
+    the records file, so its memory does not grow with the size of the wiki.
+
+    The version is built in a temporary directory, renamed into place and
+    only then made current by rewriting CURRENT, so the backend (which swaps
+    versions when CURRENT changes) never sees a half-built or half-updated
+    index, and never reads the files the pipeline is writing.
+
+    Args:
+        collections (list): Chroma collections to export (default: all of them)
+        root (str): Directory holding the versions
+        dtype (str): "float32" or "float16" (half the memory, slightly lower precision)
+        batch_size (int): Records per Chroma get call
+
+    Returns:
+        str: Name of the published version
+    """
+    collections = all_collections() if collections is None else collections
+    total = sum(collection.count() for collection in collections)
+
+    name = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    build_path = os.path.join(root, BUILD_PREFIX + name)
+    os.makedirs(build_path)
+    matrix = None
+    partitions = {}
+    row = 0
+    with open(os.path.join(build_path, RECORDS_FILE), "w", encoding="utf-8") as f:
+        f.write('{"records": [')
+        for collection in collections:
+            for offset in range(0, collection.count(), batch_size):
+                records = collection.get(
+                    limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"]
+                )
+                vectors = np.asarray(records["embeddings"], dtype=np.float32)
+                if not len(vectors):
+                    continue
+                if matrix is None:
+                    # The pipeline is the only writer and publishes after writing,
+                    # so the counts taken above hold for the whole export.
+                    matrix = np.lib.format.open_memmap(
+                        os.path.join(build_path, EMBEDDINGS_FILE), mode="w+",
+                        dtype=dtype, shape=(total, vectors.shape[1]),
+                    )
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                matrix[row:row + len(vectors)] = vectors / np.where(norms == 0, 1, norms)
+                for doc_id, document, metadata in zip(records["ids"], records["documents"], records["metadatas"]):
+                    f.write(("," if row else "") + "\n" + json.dumps([doc_id, document, metadata]))
+                    ranges = partitions.setdefault((metadata or {}).get("spaceKey", ""), [])
+                    if ranges and ranges[-1][1] == row:
+                        ranges[-1][1] = row + 1
+                    else:
+                        ranges.append([row, row + 1])
+                    row += 1
+        f.write("\n], " + json.dumps({"partitions": partitions})[1:])
+    if matrix is None:
+        np.save(os.path.join(build_path, EMBEDDINGS_FILE), np.zeros((0, 0), dtype=dtype))
+    else:
+        matrix.flush()
+        del matrix
+    if os.path.exists(LEXICAL_INDEX_PATH):
+        _copy_sqlite(LEXICAL_INDEX_PATH, os.path.join(build_path, LEXICAL_FILE))
+    os.rename(build_path, os.path.join(root, name))
+
+    pointer = os.path.join(root, CURRENT_FILE)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(pointer + ".tmp", pointer)
+
+    _prune_snapshots(root, name)
+    return name
+
+
+def _copy_sqlite(source, target):
+    # The backup API copies a consistent state even while the file is in use.
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+        # The copy is read-only from now on; a rollback journal leaves no -wal files next to it.
+        dst.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dst.close()
+        src.close()
+
+
+def _prune_snapshots(root, current, keep=SNAPSHOT_KEEP):
+    # Older versions are kept for a while: a backend that has not noticed the
+    # new CURRENT yet may still be reading one. Builds left behind by a
+    # crashed run are removed.
+    names = sorted(
+        name for name in os.listdir(root)
+        if name != current and os.path.isdir(os.path.join(root, name)) and not name.startswith(BUILD_PREFIX)
+    )
+    stale = names[:max(len(names) - max(keep - 1, 0), 0)]
+    stale += [name for name in os.listdir(root) if name.startswith(BUILD_PREFIX)]
+    for name in stale:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,67 @@
+import os
+import queue
+import threading
+
+# Items buffered between two pipeline stages; bounds memory to a few pages
+# per stage however large the wiki is.
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def run_stage(iterable, name, maxsize=PIPELINE_QUEUE_SIZE):
+    """
+    Drive iterable on a background thread and hand its items over through a
+    bounded queue, so this stage runs concurrently with whoever consumes it
+    and blocks once the consumer falls maxsize items behind.
+
+    An exception in the stage is re-raised in the consumer. If the consumer
+    stops early, the stage stops at its next item.
+
+    Args:
+        iterable (iterable): The stage's work, e.g. a generator over pages
+        name (str): Thread name, for debugging
+        maxsize (int): Items buffered between the stage and its consumer
+
+    Yields:
+        The items of iterable, in order
+    """
+    items = queue.Queue(maxsize=max(maxsize, 1))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(_Failure(e))
+        else:
+            put(_END)
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
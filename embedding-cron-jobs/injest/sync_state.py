@@ -0,0 +1,42 @@
+import json
+import os
+from datetime import datetime
+
+from injest.embedder import CHROMA_PATH
+
+SYNC_STATE_PATH = os.path.join(CHROMA_PATH, "sync_state.json")
+
+# CQL compares lastmodified in the Confluence user's timezone at minute
+# granularity, so each incremental run looks back this far past the
+# watermark. Pages seen again are skipped by their version number.
+SYNC_OVERLAP_MINUTES = int(os.getenv("SYNC_OVERLAP_MINUTES", "1440"))
+
+
+def load_sync_state(path=SYNC_STATE_PATH):
+    """
+    Load the state of the last successful sync.
+
+    Returns:
+        dict: {"watermark": ISO timestamp or None,
+               "pages": {pageId: {"version": int, "title": str}}}
+    """
+    if not os.path.exists(path):
+        return {"watermark": None, "pages": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_sync_state(state, path=SYNC_STATE_PATH):
+    """Write the sync state atomically so a crash never leaves a torn file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def watermark_datetime(state):
+    return datetime.fromisoformat(state["watermark"]) if state.get("watermark") else None
+
+
+def version_number(page):
+    return page.get("version", {}).get("number")
@@ -0,0 +1,59 @@
+import math
+import os
+import re
+from functools import lru_cache
+
+# Optional Hugging Face tokenizer (a tokenizer.json path or a hub model id,
+# e.g. "mistralai/Mistral-7B-v0.1") to measure chunks in real model tokens.
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "")
+
+_WORD_OR_SYMBOL = re.compile(r"\w+|[^\w\s]")
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if _tokenizer_loaded:
+        return _tokenizer
+    _tokenizer_loaded = True
+    if not CHUNK_TOKENIZER:
+        return None
+    try:
+        from tokenizers import Tokenizer
+        if os.path.exists(CHUNK_TOKENIZER):
+            _tokenizer = Tokenizer.from_file(CHUNK_TOKENIZER)
+        else:
+            _tokenizer = Tokenizer.from_pretrained(CHUNK_TOKENIZER)
+    except Exception as e:
+        print(f"Could not load tokenizer {CHUNK_TOKENIZER!r} ({e}); estimating token counts instead")
+    return _tokenizer
+
+
+def estimate_tokens(text):
+    """
+    Approximate a subword tokenizer: one token per symbol and roughly one per
+    four characters of each word.
+    """
+    return sum(
+        math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _WORD_OR_SYMBOL.findall(text)
+    )
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    """
+    Number of model tokens in text, using CHUNK_TOKENIZER when configured.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Token count
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return estimate_tokens(text)
@@ -1,17 +1,121 @@
 
 from bs4 import BeautifulSoup, NavigableString, Tag
-import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from injest.tokens import count_tokens
+import importlib.util
+import os
 import re
 
-def chunk_html(soup, max_chunk_size=1000):
+TRANSFORM_WORKERS = int(os.getenv("TRANSFORM_WORKERS", "1"))
+
+# Sections longer than this are split so every chunk, and therefore every
+# prompt built from chunks, stays within a predictable token budget.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+
+# "lxml" parses much faster than the pure-Python html.parser; it is optional
+# and only used when installed.
+HTML_PARSER = os.getenv("TRANSFORM_HTML_PARSER", "html.parser")
+if HTML_PARSER == "lxml" and importlib.util.find_spec("lxml") is None:
+    print("TRANSFORM_HTML_PARSER=lxml but lxml is not installed; using html.parser")
+    HTML_PARSER = "html.parser"
+
+
+def make_chunk_id(page_id, chunk_index):
+    """Deterministic chunk ID, so re-ingesting a page overwrites its chunks in place."""
+    return f"{page_id}-{chunk_index}"
+
+
+HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+CONTENT_TAGS = ["p", "ul", "ol", "pre", "table", "blockquote"]
+
+
+def _section_ends(headings):
+    """
+    For every heading, the index of the next heading at the same or a higher
+    level (None if there is none), and its heading path (the texts of the
+    enclosing headings followed by its own), using a monotonic stack in O(H).
+    """
+    ends = [None] * len(headings)
+    paths = []
+    stack = []
+    for i, heading in enumerate(headings):
+        while stack and headings[stack[-1]]["level"] >= heading["level"]:
+            ends[stack.pop()] = i
+        paths.append([headings[k]["text"] for k in stack] + [heading["text"]])
+        stack.append(i)
+    return ends, paths
+
+
+def _collect_sections(headings):
+    """
+    Gather each heading's own content and sub-sections in a single pass.
+
+    A section runs along its heading's siblings until the next heading at the
+    same or a higher level. Rather than re-walking the siblings for every
+    heading, each sibling chain is walked once while a stack of the sections
+    still open in it is kept; every element is handed to those sections.
+    """
+    ends, paths = _section_ends(headings)
+    index_of = {id(h["element"]): i for i, h in enumerate(headings)}
+    sections = [
+        {"level": h["level"], "end": headings[ends[i]]["element"] if ends[i] is not None else None,
+         "path": paths[i], "content_elements": [], "sub_sections": []}
+        for i, h in enumerate(headings)
+    ]
+
+    # Each sibling chain is walked once, starting from its first heading.
+    chain_starts = {}
+    for heading in headings:
+        chain_starts.setdefault(id(heading["element"].parent), heading["element"])
+
+    for first_heading in chain_starts.values():
+        open_sections = []
+        current = first_heading
+        while current is not None:
+            if isinstance(current, Tag):
+                is_heading = current.name in HEADING_TAGS
+                if is_heading and open_sections:
+                    open_sections = [
+                        section for section in open_sections
+                        if not _ends_section(current, section["end"])
+                    ]
+
+                for section in open_sections:
+                    if is_heading:
+                        if int(current.name[1]) > section["level"]:
+                            section["sub_sections"].append({
+                                "title": current.get_text(" ", strip=True),
+                                "content": []
+                            })
+                    elif current.name in CONTENT_TAGS:
+                        if section["sub_sections"]:
+                            section["sub_sections"][-1]["content"].append(current)
+                        else:
+                            section["content_elements"].append(current)
+
+                if is_heading and id(current) in index_of:
+                    open_sections.append(sections[index_of[id(current)]])
+            current = current.next_sibling
+
+    return sections
+
+
+def _ends_section(element, end_element):
+    # Tags compare structurally, so an identical copy of the end heading also
+    # ends the section.
+    if end_element is None or element.name != end_element.name:
+        return False
+    return element is end_element or element == end_element
+
+
+def chunk_html(soup, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
     chunks = []
     
-    # Define heading hierarchy
-    heading_tags = ["h1", "h2", "h3", "h4", "h5", "h6"]
-    
     # Get all headings with their hierarchy level
     headings = []
-    for heading in soup.find_all(heading_tags):
+    for heading in soup.find_all(HEADING_TAGS):
         level = int(heading.name[1])  # h1 -> 1, h2 -> 2, etc.
         headings.append({
             "element": heading,
@@ -19,58 +123,22 @@ def chunk_html(soup, max_chunk_size=1000):
             "text": heading.get_text(" ", strip=True)
         })
     
-    # Process each heading with its complete content
-    for i, heading_info in enumerate(headings):
-        heading = heading_info["element"]
-        current_level = heading_info["level"]
-        
-        # Find all content between this heading and the next heading of same or higher level
-        content_elements = []
-        
-        # Get next heading at same or higher level
-        next_heading_index = None
-        for j in range(i + 1, len(headings)):
-            if headings[j]["level"] <= current_level:
-                next_heading_index = j
-                break
-        
-        # Collect all elements between current and next heading
-        current = heading.next_sibling
-        end_element = headings[next_heading_index]["element"] if next_heading_index else None
-        
-        # Include sub-headings and their content
-        sub_sections = []
-        
-        while current and current != end_element:
-            if isinstance(current, Tag):
-                if current.name in heading_tags:
-                    # This is a sub-heading
-                    sub_level = int(current.name[1])
-                    if sub_level > current_level:
-                        sub_sections.append({
-                            "title": current.get_text(" ", strip=True),
-                            "content": []
-                        })
-                elif current.name in ["p", "ul", "ol", "pre", "table", "blockquote"]:
-                    # Regular content
-                    if sub_sections:
-                        # Add to the last sub-section
-                        sub_sections[-1]["content"].append(current)
-                    else:
-                        content_elements.append(current)
-            
-            current = current.next_sibling
-        
+    sections = _collect_sections(headings)
+    
+    for heading_info, section in zip(headings, sections):
         # Format the complete chunk
-        chunk_content = format_section_content(heading_info["text"], content_elements, sub_sections)
+        chunk_content = format_section_content(
+            heading_info["text"], section["content_elements"], section["sub_sections"]
+        )
         
         # Only create chunk if there's meaningful content
         if chunk_content["content"].strip():
             # Check if we need to split due to size
-            if len(chunk_content["content"].split()) > max_chunk_size:
-                # Split large chunks while keeping sub-sections together
-                split_chunks = chunk_content
-                chunks.extend(split_chunks)
+            if count_tokens(chunk_content["content"]) > max_tokens:
+                blocks = section_blocks(section["content_elements"], section["sub_sections"])
+                chunks.extend(split_section(
+                    heading_info["text"], section["path"], blocks, max_tokens, overlap_tokens
+                ))
             else:
                 chunks.append(chunk_content)
     
@@ -80,7 +148,7 @@ def chunk_html(soup, max_chunk_size=1000):
         intro_content = []
         current = soup.find()
         while current and current != first_heading:
-            if isinstance(current, Tag) and current.name in ["p", "ul", "ol", "pre", "table", "blockquote"]:
+            if isinstance(current, Tag) and current.name in CONTENT_TAGS:
                 intro_content.append(current)
             current = current.next_sibling
         
@@ -89,10 +157,186 @@ def chunk_html(soup, max_chunk_size=1000):
             for el in intro_content:
                 intro_chunk["content"] += format_element_content(el) + "\n"
             if intro_chunk["content"].strip():
-                chunks.insert(0, intro_chunk)
+                if count_tokens(intro_chunk["content"]) > max_tokens:
+                    blocks = section_blocks(intro_content, [])
+                    chunks[:0] = split_section(
+                        "Introduction", ["Introduction"], blocks, max_tokens, overlap_tokens
+                    )
+                else:
+                    chunks.insert(0, intro_chunk)
     
     return chunks
 
+def section_blocks(content_elements, sub_sections):
+    """
+    The formatted blocks of a section in order, each a unit that splitting
+    must not break unless it alone exceeds the budget. A sub-section heading
+    is kept with its first block so it never ends up alone.
+    """
+    blocks = []
+    for el in content_elements:
+        formatted = clean_content(format_element_content(el))
+        if formatted:
+            blocks.append(formatted)
+    
+    for sub in sub_sections:
+        heading = f"### {sub['title']}"
+        for el in sub["content"]:
+            formatted = clean_content(format_element_content(el))
+            if not formatted:
+                continue
+            if heading:
+                formatted = f"{heading}\n\n{formatted}"
+                heading = None
+            blocks.append(formatted)
+    return blocks
+
+def split_section(title, heading_path, blocks, max_tokens, overlap_tokens):
+    """
+    Pack a section's blocks into chunks of at most max_tokens tokens.
+
+    Every chunk starts with the section's heading path so it stays
+    self-describing, and repeats up to overlap_tokens tokens from the end of
+    the previous chunk. Blocks that are too large on their own (long code,
+    tables or lists) are split on line boundaries, and lines on words.
+    """
+    prefix = " > ".join(heading_path)
+    budget = max(max_tokens - count_tokens(prefix) - 2, 1)
+    
+    pieces = []
+    for block in blocks:
+        if count_tokens(block) > budget:
+            pieces.extend(_split_block(block, budget))
+        else:
+            pieces.append(block)
+    
+    groups = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and current_tokens + tokens > budget:
+            groups.append(current)
+            current = _overlap(current, min(overlap_tokens, budget - tokens))
+            current_tokens = sum(count_tokens(p) for p in current)
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    
+    return [
+        {
+            "title": f"{title} (part {i + 1}/{len(groups)})" if len(groups) > 1 else title,
+            "content": f"{prefix}\n\n" + "\n\n".join(group),
+        }
+        for i, group in enumerate(groups)
+    ]
+
+def _overlap(pieces, overlap_tokens):
+    """Trailing pieces (or the tail of the last prose piece) worth at most overlap_tokens."""
+    carry = []
+    total = 0
+    for piece in reversed(pieces):
+        tokens = count_tokens(piece)
+        if total + tokens <= overlap_tokens:
+            carry.insert(0, piece)
+            total += tokens
+            continue
+        if not carry and "```" not in piece and " | " not in piece:
+            tail = _tail_words(piece, overlap_tokens)
+            if tail:
+                carry = [tail]
+        break
+    return carry
+
+def _tail_words(text, max_tokens):
+    words = text.split()
+    space = count_tokens(" ")
+    tail = []
+    total = 0
+    for word in reversed(words):
+        tokens = count_tokens(word) + (space if tail else 0)
+        if total + tokens > max_tokens:
+            break
+        tail.insert(0, word)
+        total += tokens
+    return " ".join(tail)
+
+def _split_block(block, budget):
+    """
+    Split one oversized block on line boundaries, keeping code fences and
+    table headers. A sub-heading is kept on the first piece and counts
+    against that piece's budget.
+    """
+    lines = block.split("\n")
+    lead = None
+    if len(lines) > 2 and lines[0].startswith("### ") and not lines[1]:
+        # Sub-section heading attached by section_blocks; it goes on the first piece only.
+        lead = lines[0]
+        lines = lines[2:]
+    fence = lines[0].startswith("```") and lines[-1].startswith("```") and len(lines) > 1
+    header = []
+    if fence:
+        lines = lines[1:-1]
+    elif len(lines) > 2 and " | " in lines[0] and lines[1].startswith("---"):
+        header = lines[:2]
+        lines = lines[2:]
+    lead_tokens = count_tokens(lead) + count_tokens("\n\n") if lead else 0
+    if header and count_tokens("\n".join(header)) > (budget - lead_tokens) // 2:
+        # Repeating a header this wide would leave little room for rows.
+        lines = header + lines
+        header = []
+    
+    def wrap(group):
+        body = "\n".join(header + group)
+        return f"```\n{body}\n```" if fence else body
+    
+    # Joins are measured with the same counter as the text, so pieces are
+    # packed right up to the budget.
+    newline = count_tokens("\n")
+    overhead = count_tokens(wrap([]))
+    
+    pieces = []
+    group = []
+    group_tokens = 0
+    for line in lines:
+        line_budget = max(budget - overhead - (0 if pieces else lead_tokens), 1)
+        line_tokens = count_tokens(line) + newline
+        if line_tokens > line_budget:
+            if group:
+                pieces.append(wrap(group))
+                group, group_tokens = [], 0
+                line_budget = max(budget - overhead, 1)
+            pieces.extend(wrap([part]) for part in _split_words(line, line_budget - newline))
+            continue
+        if group and group_tokens + line_tokens > line_budget:
+            pieces.append(wrap(group))
+            group, group_tokens = [], 0
+        group.append(line)
+        group_tokens += line_tokens
+    if group:
+        pieces.append(wrap(group))
+    if lead and pieces:
+        pieces[0] = f"{lead}\n\n{pieces[0]}"
+    return pieces
+
+def _split_words(text, budget):
+    space = count_tokens(" ")
+    parts = []
+    current = []
+    current_tokens = 0
+    for word in text.split():
+        tokens = count_tokens(word) + (space if current else 0)
+        if current and current_tokens + tokens > budget:
+            parts.append(" ".join(current))
+            current, current_tokens = [], 0
+            tokens = count_tokens(word)
+        current.append(word)
+        current_tokens += tokens
+    if current:
+        parts.append(" ".join(current))
+    return parts
+
 def format_section_content(main_title, content_elements, sub_sections):
     """Format a section with its main content and sub-sections"""
     chunk = {"title": main_title, "content": ""}
@@ -202,32 +446,110 @@ def clean_content(content):
     
     return '\n'.join(cleaned_lines).strip()
 
-def transform_fetched_pages(fetched_pages):
-    transformed_chunks = []
+def parse_storage(html, parser=HTML_PARSER):
+    """
+    Parse a page's storage-format body.
+
+    Parsers other than html.parser wrap the fragment in <html><body>; the
+    <body> element is returned instead so the chunker sees the same tree
+    shape either way.
+    """
+    soup = BeautifulSoup(html, parser)
+    if parser != "html.parser" and soup.body is not None:
+        return soup.body
+    return soup
+
+
+def transform_page(page, parser=HTML_PARSER):
+    """
+    Chunk a single Confluence page.
+
+    Args:
+        page (dict): Confluence page object with body.storage
+        parser (str): BeautifulSoup parser backend
+
+    Returns:
+        list: Chunks ready for embedding
+    """
+    soup = parse_storage(page["body"]["storage"]["value"], parser)
     
-    for page in fetched_pages:
-        soup = BeautifulSoup(page["body"]["storage"]["value"], "html.parser")
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        chunks = chunk_html(soup, max_chunk_size=1000)
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.decompose()
+    
+    chunks = chunk_html(soup)
+    
+    transformed_chunks = []
+    for i, chunk in enumerate(chunks):
+        chunk_id = make_chunk_id(page["id"], i)
         
-        for i, chunk in enumerate(chunks):
-            chunk_id = str(uuid.uuid4())
-            
-            # Format title with page context
-            title = chunk['title'] or "Untitled Section"
-            if page['title']:
-                title = f"{title} ({page['title']})"
-            transformed_chunks.append({
-                "id": chunk_id,
-                "title": title,
-                "content": chunk["content"],
-                "pageId": page["id"],
-                "pageTitle": page["title"],
-                "chunkIndex": i,
-                "updated_at": page.get("version", {}).get("when", "")
-            })
-    return transformed_chunks
\ No newline at end of file
+        # Format title with page context
+        title = chunk['title'] or "Untitled Section"
+        if page['title']:
+            title = f"{title} ({page['title']})"
+        transformed_chunks.append({
+            "id": chunk_id,
+            "title": title,
+            "content": chunk["content"],
+            "pageId": page["id"],
+            "pageTitle": page["title"],
+            "spaceKey": (page.get("space") or {}).get("key", ""),
+            "chunkIndex": i,
+            "updated_at": page.get("version", {}).get("when", "")
+        })
+    return transformed_chunks
+
+
+def iter_transformed_pages(fetched_pages, workers=TRANSFORM_WORKERS, parser=HTML_PARSER):
+    """
+    Chunk pages as they arrive, optionally spreading them across a process
+    pool, yielding each page with its chunks in input order.
+
+    fetched_pages may be a generator; with workers > 1 only a small window of
+    pages is in flight at a time.
+
+    Args:
+        fetched_pages (iterable): Confluence page objects with body.storage
+        workers (int): Worker processes (1 = transform in this process,
+            0 = one per CPU)
+        parser (str): BeautifulSoup parser backend
+
+    Yields:
+        tuple: (page, list of chunks ready for embedding)
+    """
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        for page in fetched_pages:
+            yield page, transform_page(page, parser)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        window = deque()
+        for page in fetched_pages:
+            window.append((page, executor.submit(transform_page, page, parser)))
+            if len(window) >= workers * 2:
+                done_page, future = window.popleft()
+                yield done_page, future.result()
+        while window:
+            done_page, future = window.popleft()
+            yield done_page, future.result()
+
+
+def transform_fetched_pages(fetched_pages, workers=TRANSFORM_WORKERS, parser=HTML_PARSER):
+    """
+    Chunk every page, optionally spreading pages across a process pool.
+
+    Args:
+        fetched_pages (iterable): Confluence page objects with body.storage
+        workers (int): Worker processes (1 = transform in this process,
+            0 = one per CPU)
+        parser (str): BeautifulSoup parser backend
+
+    Returns:
+        list: Chunks ready for embedding, in page order
+    """
+    transformed_chunks = []
+    for _, chunks in iter_transformed_pages(fetched_pages, workers, parser):
+        transformed_chunks.extend(chunks)
+    return transformed_chunks
@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+# How long the first call of a batch waits for others to join it. 0 disables
+# batching: every call runs on its own, as before.
+BATCH_WINDOW_MS = float(os.getenv("IKB_BATCH_WINDOW_MS", "2"))
+BATCH_MAX_SIZE = int(os.getenv("IKB_BATCH_MAX_SIZE", "32"))
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into one call of a batch function.
+
+    Callers submit a single item and await its result; items submitted within
+    the window (or until max_size is reached) are passed together to func,
+    which runs on the given executor and must return one result per item, in
+    order. Used to turn many single-query embedding and vector-search calls
+    into a few multi-query ones.
+    """
+
+    def __init__(self, func, executor, window_ms=BATCH_WINDOW_MS, max_size=BATCH_MAX_SIZE):
+        self.func = func
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_size = max(max_size, 1)
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+
+    async def submit(self, item):
+        """
+        Add an item to the next batch and wait for its result.
+
+        Args:
+            item: One input for func
+
+        Returns:
+            The result func produced for this item
+        """
+        loop = asyncio.get_running_loop()
+        if self.window <= 0:
+            self._record(1)
+            return (await loop.run_in_executor(self.executor, self.func, [item]))[0]
+
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run(batch))
+        # Keep a reference so the task isn't garbage collected mid-flight.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self._record(len(batch))
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.func, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # The caller may have given up (e.g. the client disconnected).
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size):
+        self.batches += 1
+        self.items += size
+        self.largest_batch = max(self.largest_batch, size)
+
+    def stats(self):
+        """Return how many calls were coalesced into how many batches."""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 3) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+        }
@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ikb_backend.db import CHANGES_PATH, served_index_version
+
+CACHE_ENABLED = os.getenv("IKB_CACHE_ENABLED", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.getenv("IKB_CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL_SECONDS = float(os.getenv("IKB_CACHE_TTL_SECONDS", "3600"))
+CACHE_SIMILARITY = float(os.getenv("IKB_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_question(question):
+    """Lower-case and collapse whitespace so trivially different questions share a key."""
+    return " ".join(question.lower().split())
+
+
+class SemanticCache:
+    """
+    LRU + TTL cache of answers keyed on the question's embedding.
+
+    A lookup first tries the normalized question text, then falls back to the
+    most similar cached question by cosine similarity. Entries remember which
+    chunk IDs their answer was generated from and are dropped when the ingest
+    pipeline reports one of those chunks as changed (see CHANGES_PATH). A
+    change that arrives with a snapshot is held until that snapshot is being
+    served, so answers cached from the old one in between are dropped too.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS,
+                 similarity_threshold=CACHE_SIMILARITY, changes_path=CHANGES_PATH,
+                 served_version=served_index_version):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.changes_path = changes_path
+        self.served_version = served_version
+
+        self._entries = OrderedDict()
+        self._keys_by_chunk = {}
+        self._matrix = None
+        self._matrix_keys = []
+        self._changes_offset = None
+        # (snapshot, chunk IDs) of changes the served snapshot doesn't hold yet.
+        self._deferred = []
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, question, embedding):
+        """
+        Find a cached answer for a question.
+
+        Args:
+            question (str): The user's question
+            embedding (numpy.ndarray): Embedding of the question
+
+        Returns:
+            str: The cached answer, or None on a miss
+        """
+        self.refresh_invalidations()
+        key = normalize_question(question)
+
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None and self._entries:
+                key = self._nearest(embedding)
+                entry = self._entries.get(key) if key is not None else None
+                if entry is not None:
+                    self.near_hits += 1
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["answer"]
+
+    def store(self, question, embedding, answer, chunk_ids):
+        """
+        Cache an answer together with the chunk IDs it was generated from.
+
+        Args:
+            question (str): The user's question
+            embedding (numpy.ndarray): Embedding of the question
+            answer (str): The generated answer
+            chunk_ids (list): IDs of the chunks used as context
+        """
+        key = normalize_question(question)
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "answer": answer,
+                "embedding": vector,
+                "chunk_ids": list(chunk_ids),
+                "created_at": time.monotonic(),
+            }
+            for chunk_id in chunk_ids:
+                self._keys_by_chunk.setdefault(chunk_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            self._matrix = None
+
+    def invalidate_chunks(self, chunk_ids):
+        """Drop every cached answer that was built from any of the given chunks."""
+        with self._lock:
+            keys = set()
+            for chunk_id in chunk_ids:
+                keys |= self._keys_by_chunk.get(chunk_id, set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            if keys:
+                self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_chunk.clear()
+            self._matrix = None
+
+    def refresh_invalidations(self):
+        """Apply any chunk changes the ingest pipeline appended since the last check."""
+        self._read_changes()
+        if self._deferred:
+            version = self.served_version()
+            # Snapshot names are UTC timestamps, so they sort by publication.
+            due = [ids for snapshot, ids in self._deferred if version is None or snapshot <= version]
+            if due:
+                self._deferred = [(s, ids) for s, ids in self._deferred if version is not None and s > version]
+                self.invalidate_chunks([chunk_id for ids in due for chunk_id in ids])
+
+    def _read_changes(self):
+        try:
+            size = os.path.getsize(self.changes_path)
+        except OSError:
+            if self._changes_offset is None:
+                self._changes_offset = 0
+            return
+
+        if self._changes_offset is None:
+            # Changes made before this process started can't affect its cache.
+            self._changes_offset = size
+            return
+        if size < self._changes_offset:
+            # The log was truncated or replaced; we can't tell what changed.
+            self.clear()
+            self._changes_offset = size
+            return
+        if size == self._changes_offset:
+            return
+
+        changed = []
+        with open(self.changes_path, "r", encoding="utf-8") as f:
+            f.seek(self._changes_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # partially written record; read it next time
+                self._changes_offset += len(line.encode("utf-8"))
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        # E.g. left by a crashed ingest run; the offset is already past it.
+                        print(f"Skipping unreadable line in {self.changes_path}: {e}")
+                        continue
+                    if not isinstance(record, dict):
+                        print(f"Skipping unexpected record in {self.changes_path}: {line.strip()[:80]}")
+                        continue
+                    if record.get("snapshot"):
+                        self._deferred.append((record["snapshot"], record.get("ids", [])))
+                    else:
+                        changed.extend(record.get("ids", []))
+        if changed:
+            self.invalidate_chunks(changed)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled": CACHE_ENABLED,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _nearest(self, embedding):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[k]["embedding"] for k in self._matrix_keys])
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return None
+        similarities = self._matrix @ (query / norm)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return self._matrix_keys[best]
+
+    def _expire(self):
+        if self.ttl_seconds <= 0:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [k for k, e in self._entries.items() if e["created_at"] < cutoff]
+        for key in expired:
+            self._remove(key)
+            self.evictions += 1
+        if expired:
+            self._matrix = None
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for chunk_id in entry["chunk_ids"]:
+            keys = self._keys_by_chunk.get(chunk_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_chunk[chunk_id]
+
+
+answer_cache = SemanticCache()
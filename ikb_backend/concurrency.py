@@ -0,0 +1,110 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from ikb_backend.metrics import observe_stage
+
+
+class OverloadedError(Exception):
+    """Raised when a request is turned away instead of queued."""
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of chat requests being processed at once and records how
+    long requests wait in line before they get a slot.
+
+    The line itself is bounded: once max_queued requests are waiting, or a
+    request has waited queue_timeout seconds, it is rejected with
+    OverloadedError so callers fail fast instead of piling up. Work admitted
+    ahead of time (the questions of a batch) waits in the same line but is
+    counted separately in batch_waiting, so it never fills the line for others.
+    """
+
+    def __init__(self, max_concurrent, max_queued=None, queue_timeout=None):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+        self.batch_waiting = 0
+        self.rejected = 0
+        self.queue_wait_count = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def check_admission(self):
+        """
+        Reject right away if the line is already full.
+
+        Raises:
+            OverloadedError: If max_queued requests are already waiting
+        """
+        if self.max_queued is not None and self.waiting >= self.max_queued and self._semaphore.locked():
+            self.rejected += 1
+            raise OverloadedError(f"{self.waiting} requests already waiting")
+
+    @asynccontextmanager
+    async def slot(self, bounded=True):
+        """
+        Wait for a free slot, then hold it for the duration of the block.
+
+        Args:
+            bounded (bool): Apply max_queued and queue_timeout; False for work
+                that was already admitted, e.g. the questions of a batch
+
+        Yields:
+            float: Seconds spent waiting for the slot
+
+        Raises:
+            OverloadedError: If the line is full or the wait timed out
+        """
+        if bounded:
+            self.check_admission()
+        start = time.perf_counter()
+        counter = "waiting" if bounded else "batch_waiting"
+        setattr(self, counter, getattr(self, counter) + 1)
+        try:
+            if bounded and self.queue_timeout and self._semaphore.locked():
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            else:
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise OverloadedError(f"no slot free after {self.queue_timeout:g}s")
+        finally:
+            setattr(self, counter, getattr(self, counter) - 1)
+        waited = time.perf_counter() - start
+        self._record_wait(waited)
+
+        self.in_flight += 1
+        try:
+            yield waited
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def _record_wait(self, waited):
+        observe_stage("queue", waited)
+        self.queue_wait_count += 1
+        self.queue_wait_total += waited
+        self.queue_wait_max = max(self.queue_wait_max, waited)
+
+    def stats(self):
+        """Return a snapshot of the limiter state and queue-wait timings."""
+        avg = self.queue_wait_total / self.queue_wait_count if self.queue_wait_count else 0.0
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "batch_waiting": self.batch_waiting,
+            "max_queued": self.max_queued,
+            "rejected": self.rejected,
+            "queue_wait": {
+                "count": self.queue_wait_count,
+                "avg_seconds": round(avg, 6),
+                "max_seconds": round(self.queue_wait_max, 6),
+                "total_seconds": round(self.queue_wait_total, 6),
+            },
+        }
@@ -0,0 +1,121 @@
+import math
+import os
+import re
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("IKB_CONTEXT_TOKEN_BUDGET", "1500"))
+# Chroma's default space is squared L2 on unit vectors (0 = identical,
+# 2 = unrelated); passages farther than this are not worth prefilling.
+MAX_DISTANCE = float(os.getenv("IKB_MAX_DISTANCE", "1.5"))
+
+_WORD_OR_SYMBOL = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Approximate a subword tokenizer: one token per symbol and roughly one per
+    four characters of each word (same estimate as the ingest chunker).
+    """
+    return sum(
+        math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _WORD_OR_SYMBOL.findall(text)
+    )
+
+
+def _normalize(text):
+    return " ".join(text.split()).lower()
+
+
+def _truncate(text, max_tokens):
+    words = text.split()
+    kept = []
+    total = 0
+    for word in words:
+        total += estimate_tokens(word) + 1
+        if total > max_tokens:
+            break
+        kept.append(word)
+    return " ".join(kept) + " …"
+
+
+def _within_cutoff(result, max_distance):
+    # Keyword matches are kept even when their embedding is far from the query.
+    if max_distance is None or result.get("distance") is None or "lexical" in result.get("sources", ()):
+        return True
+    return result["distance"] <= max_distance
+
+
+def _relevance_key(result):
+    # Hybrid results carry a fused score (higher is better); vector-only
+    # results are ordered by distance (lower is better).
+    if result.get("score") is not None:
+        return -result["score"]
+    return result["distance"] if result.get("distance") is not None else float("inf")
+
+
+def build_context(results, token_budget=CONTEXT_TOKEN_BUDGET, max_distance=MAX_DISTANCE):
+    """
+    Turn search results into a compact, labelled context block for the prompt.
+
+    Results are ordered by relevance, dropped if farther than max_distance
+    (unless they were a keyword match),
+    deduplicated (same chunk, same text, or text contained in a passage that
+    was already selected), and added until the token budget is spent.
+
+    Args:
+        results (list): Results from semantic search
+        token_budget (int): Maximum estimated tokens of context
+        max_distance (float): Distance cutoff; None disables it
+
+    Returns:
+        tuple: (context text, list of the results that were included)
+    """
+    candidates = [r for r in results if _within_cutoff(r, max_distance)]
+    candidates.sort(key=_relevance_key)
+
+    passages = []
+    used = []
+    seen_ids = set()
+    seen_texts = []
+    remaining = token_budget
+
+    for result in candidates:
+        content = result.get("content", "").strip()
+        normalized = _normalize(content)
+        if not content or result.get("id") in seen_ids:
+            continue
+        if any(normalized in text for text in seen_texts):
+            continue
+
+        # A parent section also contains the text of its sub-sections; if a
+        # sub-section was already picked, the parent takes its slot instead of
+        # repeating it.
+        replaces = next((i for i, text in enumerate(seen_texts) if text in normalized), None)
+        position = replaces if replaces is not None else len(passages)
+
+        label = f"[{position + 1}] {result.get('page_title', 'Unknown Page')} — {result.get('title', 'Untitled')}"
+        passage = f"{label}\n{content}"
+        tokens = estimate_tokens(passage)
+        freed = estimate_tokens(passages[replaces]) if replaces is not None else 0
+
+        if tokens - freed > remaining:
+            if passages:
+                continue
+            # Never send an empty context just because the best passage is long.
+            passage = _truncate(passage, remaining)
+            tokens = remaining
+
+        if replaces is not None:
+            passages[replaces] = passage
+            seen_ids.discard(used[replaces].get("id"))
+            used[replaces] = result
+            seen_texts[replaces] = normalized
+        else:
+            passages.append(passage)
+            used.append(result)
+            seen_texts.append(normalized)
+        seen_ids.add(result.get("id"))
+        remaining -= tokens - freed
+        if remaining <= 0:
+            break
+
+    return "\n\n".join(passages), used
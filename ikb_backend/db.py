@@ -1,51 +1,374 @@
-import chromadb
+import asyncio
+import numpy as np
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ikb_backend.batching import MicroBatcher
+from ikb_backend.vector_index import VectorIndex
 
 # Use an absolute path for the persistent database
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../chroma_db'))
+DB_PATH = os.path.abspath(os.getenv("IKB_CHROMA_PATH", os.path.join(os.path.dirname(__file__), '../chroma_db')))
 
 # Ensure the directory exists
 os.makedirs(DB_PATH, exist_ok=True)
 
-client = chromadb.PersistentClient(path=DB_PATH)
-collection = client.get_or_create_collection(name="advantalabs")
+# The ingest pipeline appends the IDs of every chunk it rewrites or removes here
+CHANGES_PATH = os.path.join(DB_PATH, "changes.jsonl")
 
+# Same model Chroma uses by default; kept explicit so queries can be embedded
+# once and the vector reused for both the answer cache and retrieval. Created
+# on first use (chromadb takes a while to import and the model to load), so
+# the server starts accepting connections while it warms up in the background.
+embedding_function = None
 
-def semantic_search(query_text, n_results=6):
+# "snapshot" serves the immutable index versions the ingest pipeline
+# publishes, swapping to each new one without a restart (falling back to
+# Chroma until one has been published); "chroma" queries the collection the
+# pipeline is writing to.
+VECTOR_ENGINE = os.getenv("IKB_VECTOR_ENGINE", "snapshot")
+vector_index = VectorIndex(os.path.join(DB_PATH, "snapshots"))
+
+client = None
+_client_lock = threading.Lock()
+# The ingest pipeline stores each Confluence space in a collection of its own
+# ("advantalabs-<space key>", with the key in the collection metadata);
+# "advantalabs" holds chunks stored without partitioning.
+COLLECTION_NAME = "advantalabs"
+PARTITION_CHECK_SECONDS = float(os.getenv("IKB_PARTITION_CHECK_SECONDS", "30"))
+
+# Chroma queries are blocking, so async callers run them on a bounded pool
+# instead of on the event loop.
+RETRIEVAL_WORKERS = int(os.getenv("IKB_RETRIEVAL_WORKERS", "4"))
+_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="ikb-retrieval")
+# Partitions a search covers are queried concurrently on their own pool, so
+# fan-out from a retrieval thread never waits on the retrieval pool itself.
+PARTITION_FANOUT_WORKERS = int(os.getenv("IKB_PARTITION_FANOUT_WORKERS", "4"))
+_fanout_executor = ThreadPoolExecutor(max_workers=PARTITION_FANOUT_WORKERS, thread_name_prefix="ikb-fanout")
+
+_partitions = {}
+_partitions_checked_at = None
+_partitions_lock = threading.Lock()
+
+
+def get_client():
+    """The persistent Chroma client, opened on first use."""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                import chromadb
+
+                client = chromadb.PersistentClient(path=DB_PATH)
+    return client
+
+
+def get_embedding_function():
+    """The query embedding function, created on first use."""
+    global embedding_function
+    if embedding_function is None:
+        with _client_lock:
+            if embedding_function is None:
+                from chromadb.utils import embedding_functions
+
+                embedding_function = embedding_functions.DefaultEmbeddingFunction()
+    return embedding_function
+
+
+def partition_collections():
+    """
+    Collections of the store by partition key; None is the unpartitioned
+    collection. Re-listed periodically so new spaces are picked up.
+
+    Returns:
+        dict: partition key -> chromadb.Collection
+    """
+    global _partitions, _partitions_checked_at
+    now = time.monotonic()
+    if _partitions_checked_at is not None and now - _partitions_checked_at < PARTITION_CHECK_SECONDS:
+        return _partitions
+    with _partitions_lock:
+        if _partitions_checked_at is None or now - _partitions_checked_at >= PARTITION_CHECK_SECONDS:
+            partitions = {}
+            for listed in get_client().list_collections():
+                if listed.name != COLLECTION_NAME and not listed.name.startswith(COLLECTION_NAME + "-"):
+                    continue
+                found = get_client().get_collection(listed.name, embedding_function=get_embedding_function())
+                partitions[(found.metadata or {}).get("partition")] = found
+            _partitions = partitions
+            _partitions_checked_at = now
+    return _partitions
+
+
+def embed_query(query_text):
+    """
+    Embed a query with the collection's embedding model.
+
+    Args:
+        query_text (str): The query text to embed
+
+    Returns:
+        numpy.ndarray: The query embedding as float32
+    """
+    return np.asarray(get_embedding_function()([query_text])[0], dtype=np.float32)
+
+
+def embed_queries(query_texts):
+    """
+    Embed several queries in one call of the embedding model.
+
+    Args:
+        query_texts (list): The query texts to embed
+
+    Returns:
+        numpy.ndarray: One float32 embedding per row
+    """
+    return np.asarray(get_embedding_function()(list(query_texts)), dtype=np.float32)
+
+
+def semantic_search(query_text, n_results=6, query_embedding=None, scope=None):
     """
     Performs semantic search on embedded documents using vector similarity.
     
     Args:
         query_text (str): The query text to search for
-        n_results (int): Number of results to return (default: 5)
+        n_results (int): Number of results to return (default: 6)
+        query_embedding (numpy.ndarray): Precomputed embedding of query_text, if available
+        scope (iterable): Space keys to search; None searches every space
         
     Returns:
         list: List of formatted search results with metadata
     """
-    results = collection.query(
-        query_texts=[query_text],
-        n_results=n_results
-    )
-    
+    if query_embedding is None:
+        query_embedding = embed_query(query_text)
+    return semantic_search_batch([query_embedding], n_results, scope)[0]
+
+
+def semantic_search_batch(query_embeddings, n_results=6, scope=None):
+    """
+    Search several precomputed query embeddings with a single multi-query
+    call, against the in-memory snapshot or the Chroma collections. Chroma
+    partitions in scope are queried concurrently and their hits merged by
+    distance.
+
+    Args:
+        query_embeddings (list): Query embeddings
+        n_results (int): Number of results per query
+        scope (iterable): Space keys to search; None searches every space
+
+    Returns:
+        list: One list of formatted search results per query
+    """
+    if _use_snapshot():
+        return [
+            [_format_result(doc_id, metadata, document, distance) for doc_id, document, metadata, distance in hits]
+            for hits in vector_index.search(np.asarray(query_embeddings, dtype=np.float32), n_results, scope)
+        ]
+
+    query_embeddings = [np.asarray(e, dtype=np.float32) for e in query_embeddings]
+    targets = []
+    for partition, collection in partition_collections().items():
+        if partition is None:
+            # Unpartitioned chunks are scoped by their metadata instead.
+            targets.append((collection, {"spaceKey": {"$in": list(scope)}} if scope is not None else None))
+        elif scope is None or partition in scope:
+            targets.append((collection, None))
+    if len(targets) == 1:
+        per_target = [_query_collection(*targets[0], query_embeddings, n_results)]
+    else:
+        per_target = list(_fanout_executor.map(
+            lambda target: _query_collection(*target, query_embeddings, n_results), targets
+        ))
 
     formatted_results = []
-    
-    if results and 'metadatas' in results and len(results['metadatas']) > 0:
-        metadatas = results['metadatas'][0]
-        documents = results['documents'][0]
-        distances = results.get('distances', [[]])[0]
-        
-        for i in range(len(metadatas)):
-            formatted_results.append({
-                "title": metadatas[i].get("title", "Untitled"),
-                "page_title": metadatas[i].get("pageTitle", "Unknown Page"),
-                "content": documents[i],
-                "metadata": metadatas[i]
-            })
-    
+    for i in range(len(query_embeddings)):
+        hits = [hit for results in per_target for hit in results[i]]
+        hits.sort(key=lambda hit: hit["distance"] if hit["distance"] is not None else float("inf"))
+        formatted_results.append(hits[:n_results])
     return formatted_results
-    
 
 
+def _query_collection(collection, where, query_embeddings, n_results):
+    """One Chroma query; returns one list of formatted results per query embedding."""
+    # Chroma returns fewer results when a partition holds fewer chunks.
+    results = collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where)
+
+    formatted_results = []
+    for i in range(len(query_embeddings)):
+        ids = results['ids'][i]
+        metadatas = results['metadatas'][i]
+        documents = results['documents'][i]
+        distances = results['distances'][i] if results.get('distances') else []
+        formatted_results.append([
+            _format_result(ids[j], metadatas[j], documents[j], distances[j] if j < len(distances) else None)
+            for j in range(len(ids))
+        ])
+    return formatted_results
+
+
+def _use_snapshot():
+    # May load a newly published snapshot, so only called off the event loop.
+    return VECTOR_ENGINE == "snapshot" and vector_index.available()
+
+
+def _served_snapshot():
+    # The snapshot already loaded, if any; never loads one, so safe on the event loop.
+    return vector_index.loaded() if VECTOR_ENGINE == "snapshot" else None
+
+
+def served_index_version():
+    """Name of the snapshot queries are answered from, or None when they go to Chroma."""
+    snapshot = _served_snapshot()
+    return snapshot.name if snapshot is not None else None
+
+
+def current_lexical_path():
+    """
+    Keyword index of the index version being served, or None to use the
+    live index next to the collection.
+    """
+    snapshot = _served_snapshot()
+    return snapshot.lexical_path if snapshot is not None else None
+
+
+def index_stats():
+    return dict(vector_index.stats(), engine="snapshot" if _served_snapshot() is not None else "chroma")
+
+
+async def watch_index_versions():
+    """
+    Pick up newly published snapshots on the retrieval executor, so a swap
+    happens even while every question is answered from the cache and never
+    blocks the event loop.
+    """
+    while True:
+        await asyncio.sleep(max(vector_index.check_seconds, 1))
+        if VECTOR_ENGINE != "snapshot":
+            continue
+        try:
+            await run_in_retrieval_executor(vector_index.snapshot)
+        except Exception as e:
+            print(f"Could not check for a new vector snapshot: {e}")
+
+
+def _format_result(doc_id, metadata, document, distance=None):
+    metadata = metadata or {}
+    return {
+        "id": doc_id,
+        "distance": distance,
+        "title": metadata.get("title", "Untitled"),
+        "page_title": metadata.get("pageTitle", "Unknown Page"),
+        "content": document,
+        "metadata": metadata
+    }
+
+
+def get_documents(ids):
+    """
+    Fetch chunks by ID, in the order given.
+
+    Args:
+        ids (list): Chunk IDs
+
+    Returns:
+        list: Formatted results (without a distance) for the IDs that exist
+    """
+    if not ids:
+        return []
+    if _use_snapshot():
+        return [_format_result(doc_id, metadata, document) for doc_id, document, metadata in vector_index.get(ids)]
+    by_id = {}
+    for collection in partition_collections().values():
+        records = collection.get(ids=list(ids), include=["metadatas", "documents"])
+        by_id.update(
+            (doc_id, _format_result(doc_id, metadata, document))
+            for doc_id, metadata, document in zip(records["ids"], records["metadatas"], records["documents"])
+        )
+    return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+
+def get_embeddings(ids):
+    """
+    Fetch the stored embeddings of chunks.
+
+    Args:
+        ids (list): Chunk IDs
+
+    Returns:
+        numpy.ndarray: One float32 row per ID, in the order given; zeros for
+        IDs that no longer exist
+    """
+    if not ids:
+        return np.zeros((0, 0), dtype=np.float32)
+    if _use_snapshot():
+        return vector_index.embeddings(ids)
+    by_id = {}
+    for collection in partition_collections().values():
+        records = collection.get(ids=list(ids), include=["embeddings"])
+        by_id.update(zip(records["ids"], records["embeddings"]))
+    dimensions = len(next(iter(by_id.values()))) if by_id else 0
+    zeros = np.zeros(dimensions, dtype=np.float32)
+    return np.array([np.asarray(by_id.get(doc_id, zeros), dtype=np.float32) for doc_id in ids]).reshape(len(ids), dimensions)
+
+
+def _search_requests(requests):
+    # Requests may ask for different result counts; query the largest once
+    # per distinct scope.
+    by_scope = {}
+    for i, (_, _, scope) in enumerate(requests):
+        by_scope.setdefault(scope, []).append(i)
+    results = [None] * len(requests)
+    for scope, indices in by_scope.items():
+        n_results = max(requests[i][1] for i in indices)
+        hits = semantic_search_batch([requests[i][0] for i in indices], n_results, scope)
+        for i, query_hits in zip(indices, hits):
+            results[i] = query_hits[:requests[i][1]]
+    return results
+
+
+# Concurrent requests are coalesced into one embedding call and one
+# multi-query search, amortising the per-call overhead across requests.
+embed_batcher = MicroBatcher(embed_queries, _executor)
+search_batcher = MicroBatcher(_search_requests, _executor)
+
+
+async def embed_query_async(query_text):
+    """Async variant of embed_query, batched with concurrent callers."""
+    return await embed_batcher.submit(query_text)
+
+
+async def semantic_search_async(query_text, n_results=6, query_embedding=None, scope=None):
+    """
+    Async variant of semantic_search. Runs on the retrieval executor so the
+    event loop stays free, batched with concurrent callers.
+
+    Args:
+        query_text (str): The query text to search for
+        n_results (int): Number of results to return (default: 6)
+        query_embedding (numpy.ndarray): Precomputed embedding of query_text, if available
+        scope (iterable): Space keys to search; None searches every space
+
+    Returns:
+        list: List of formatted search results with metadata
+    """
+    if query_embedding is None:
+        query_embedding = await embed_query_async(query_text)
+    scope = tuple(sorted(set(scope))) if scope is not None else None
+    return await search_batcher.submit((query_embedding, n_results, scope))
+
+
+def batching_stats():
+    """Return micro-batching counters for the embedding and search batchers."""
+    return {"embed": embed_batcher.stats(), "search": search_batcher.stats()}
+
+
+async def run_in_retrieval_executor(func, *args):
+    """Run a blocking retrieval function on the bounded retrieval executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
 
 
+def shutdown_executor():
+    """Stop the retrieval executor, waiting for in-flight queries."""
+    _executor.shutdown(wait=True)
+    _fanout_executor.shutdown(wait=True)
@@ -0,0 +1,112 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+
+from ikb_backend.db import DB_PATH
+
+# Written by the ingest pipeline (embedding-cron-jobs/injest/lexical.py).
+LEXICAL_INDEX_PATH = os.path.join(DB_PATH, "lexical_index.sqlite3")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Must match the ingest tokenizer, or query terms won't line up with postings.
+_TOKEN = re.compile(r"[a-z0-9_]+(?:[.\-/:][a-z0-9_]+)*")
+_SEPARATORS = re.compile(r"[._\-/:]")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it of on or that the "
+    "this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """Lower-cased terms; identifiers are kept whole and also split into their parts."""
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if _SEPARATORS.search(token):
+            terms.extend(part for part in _SEPARATORS.split(token) if part and part not in STOPWORDS)
+    return terms
+
+
+class LexicalSearcher:
+    """Read-only BM25 queries over the ingest pipeline's inverted index."""
+
+    def __init__(self, path=LEXICAL_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def available(self, path=None):
+        return os.path.exists(path or self.path)
+
+    def _conn(self, path):
+        # sqlite connections can't be shared across the retrieval threads.
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(path)
+        if conn is None:
+            # A newly published index version: this thread is done with the old one.
+            for old in conns.values():
+                old.close()
+            conns.clear()
+            conn = conns[path] = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        return conn
+
+    def search(self, query_text, n_results=20, path=None, scope=None):
+        """
+        Rank chunks by BM25 against the query.
+
+        Args:
+            query_text (str): The user's question
+            n_results (int): Number of hits to return
+            path (str): Index file to search, e.g. that of the published
+                index version being served (default: the live index)
+            scope (iterable): Space keys to search; None searches every space
+
+        Returns:
+            list: (chunk id, score) pairs, best first
+        """
+        path = path or self.path
+        terms = set(tokenize(query_text))
+        if not terms or not self.available(path):
+            return []
+
+        conn = self._conn(path)
+        stats = dict(conn.execute("SELECT key, value FROM stats").fetchall())
+        doc_count = stats.get("doc_count", 0)
+        if not doc_count:
+            return []
+        avg_length = stats.get("total_length", 0) / doc_count or 1
+
+        query = "SELECT p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id WHERE p.term = ?"
+        scope = sorted(set(scope)) if scope is not None else None
+        if scope is not None:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(docs)")}
+            # Indexes written before partitioning can't be scoped.
+            if "partition" not in columns:
+                return []
+            query += f" AND d.partition IN ({','.join('?' * len(scope))})"
+
+        scores = {}
+        for term in terms:
+            postings = conn.execute(query, (term, *(scope or ()))).fetchall()
+            if not postings:
+                continue
+            # Document frequency over the whole index, so scores don't depend on the scope.
+            df = len(postings) if scope is None else conn.execute(
+                "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)
+            ).fetchone()[0]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for doc_id, tf, length in postings:
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+
+lexical_searcher = LexicalSearcher()
@@ -1,12 +1,22 @@
 
-from ikb_backend.db import semantic_search
+from contextlib import aclosing, nullcontext
+from ikb_backend.cache import CACHE_ENABLED, answer_cache
+from ikb_backend.context import build_context
+from ikb_backend.db import semantic_search, semantic_search_async, embed_query_async
+from ikb_backend.metrics import observe_stage, timed
+from ikb_backend.ollama_pool import OLLAMA_KEEP_ALIVE, OLLAMA_MODEL, OLLAMA_TIMEOUT_SECONDS, OLLAMA_URLS, ollama_pool
+from ikb_backend.retrieval import retrieve
+from ikb_backend.sessions import session_store
+from ikb_backend.streaming import AnswerStreamParser
+import asyncio
+import httpx
 import requests
 import json
 import re
+import time
 
 
-def fetch_llm_response(prompt):
-    system_Prompt = """You are given a user prompt and a context retrieved from a vector database. 
+SYSTEM_PROMPT = """You are given a user prompt and a context retrieved from a vector database. 
 The context may be incomplete, slightly inaccurate, or partially irrelevant. 
 Your task is to generate the most relevant and accurate response using the context as supporting information. 
 If the context is not useful, rely on your general knowledge.
@@ -40,31 +50,112 @@ Important:
 - If context contradicts reliable knowledge, use reliable knowledge but mention the conflict in "notes".
 """
 
+def build_llm_request(prompt, semantic_search_results, stream=False, session=None):
+    """
+    Build the Ollama /api/generate payload for a prompt and its retrieved context.
 
-    semantic_search_results = semantic_search(prompt)
+    Args:
+        prompt (str): The user's question
+        semantic_search_results (list): Results from semantic search
+        stream (bool): Whether Ollama should stream the generation
+        session (Session): Conversation the prompt continues, if any
+
+    Returns:
+        dict: The request body for Ollama
+    """
+    return _build_request(prompt, semantic_search_results, stream, session)[0]
 
 
-    prompt_with_context = f"User Prompt: {prompt} Context:{semantic_search_results}\n\n"
+def _build_request(prompt, semantic_search_results, stream=False, session=None):
+    """
+    Returns:
+        tuple: (request body, results included in the prompt)
+    """
+    if session is not None and session.context is not None:
+        # Ollama's context tokens already hold the system prompt, the earlier
+        # turns and the chunks sent with them; only new material is prefilled.
+        fresh = [r for r in semantic_search_results if r.get("id") not in session.sent_chunk_ids]
+        with timed("context"):
+            context, used = build_context(fresh)
+        return {
+            "model": OLLAMA_MODEL,
+            "prompt": f"User Prompt: {prompt}\n\nContext:\n{context or 'None beyond the earlier context'}\n\n",
+            "context": list(session.context),
+            "stream": stream,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+        }, used
 
-    ollamaUrl = "http://localhost:11434/api/generate"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    data = {
-        "Model":  "mistral",
-		"Prompt": prompt_with_context,
-		"System": system_Prompt,
-		"Stream": False,
-    }
+    with timed("context"):
+        context, used = build_context(semantic_search_results)
+    prompt_with_context = f"User Prompt: {prompt}\n\nContext:\n{context or 'None'}\n\n"
+    if session is not None and session.turns:
+        prompt_with_context = f"Conversation so far:\n{session.history_text()}\n\n{prompt_with_context}"
 
-    print(f"Sending request to LLM with prompt: {json.dumps(data)}")
+    return {
+        "model": OLLAMA_MODEL,
+        "prompt": prompt_with_context,
+        "system": SYSTEM_PROMPT,
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+    }, used
 
-    response = requests.post(ollamaUrl, headers=headers, json=data)
-    # print(f"Sending request to LLM with prompt: {prompt_with_context}")
+
+def fetch_llm_response(prompt):
+    semantic_search_results = semantic_search(prompt)
+    data = build_llm_request(prompt, semantic_search_results)
+    response = requests.post(f"{OLLAMA_URLS[0]}/api/generate", json=data, timeout=OLLAMA_TIMEOUT_SECONDS)
 
     return response.json()
 
 
+async def fetch_llm_response_async(prompt, semantic_search_results=None):
+    """
+    Async variant of fetch_llm_response: retrieval runs on the retrieval
+    executor and generation goes to the least-loaded Ollama backend. If a
+    backend refuses the connection, the request is retried on another one.
+
+    Args:
+        prompt (str): The user's question or prompt
+        semantic_search_results (list): Already retrieved context, if any
+
+    Returns:
+        dict: The raw Ollama response
+    """
+    if semantic_search_results is None:
+        semantic_search_results = await semantic_search_async(prompt)
+    data = build_llm_request(prompt, semantic_search_results)
+    response, _ = await _generate(data)
+    return response
+
+
+async def _generate(data, prefer=None):
+    """
+    Run a non-streaming generation on the pool.
+
+    Args:
+        data (dict): The request body for Ollama
+        prefer (str): URL of the backend to use if it is healthy
+
+    Returns:
+        tuple: (raw Ollama response, URL of the backend that produced it)
+    """
+    failed = []
+    while True:
+        try:
+            async with ollama_pool.backend(exclude=failed, prefer=prefer) as backend:
+                with timed("llm"):
+                    response = await backend.client.post("/api/generate", json=data)
+                    response.raise_for_status()
+                    result = response.json()
+                _observe_ollama_durations(result)
+                return result, backend.url
+        except httpx.ConnectError:
+            # Nothing was sent yet, so another backend can safely take it.
+            failed.append(backend)
+            if len(failed) >= ollama_pool.size:
+                raise
+
+
 def extract_answer_from_response(response_data):
     """
     Extract the answer from the LLM response JSON string.
@@ -138,4 +229,250 @@ def get_answer(prompt):
     return extract_answer_from_response(response)
 
 
+async def _retrieve(prompt, use_cache=True, retrieval=None):
+    """
+    Embed the prompt once, consult the answer cache, and only retrieve
+    context on a miss.
+
+    Args:
+        prompt (str): The user's question
+        use_cache (bool): Whether a cached answer may be returned
+        retrieval (dict): Keyword arguments for retrieval.retrieve overriding
+            the configured defaults
+
+    Returns:
+        tuple: (query embedding, cached answer or None, search results or None)
+    """
+    with timed("embed"):
+        embedding = await embed_query_async(prompt)
+    if CACHE_ENABLED and use_cache:
+        with timed("cache"):
+            cached = answer_cache.lookup(prompt, embedding)
+        if cached is not None:
+            return embedding, cached, None
+    with timed("retrieval"):
+        results = await retrieve(prompt, embedding, **(retrieval or {}))
+    return embedding, None, results
+
+
+def _cache_answer(prompt, embedding, answer, semantic_search_results):
+    if CACHE_ENABLED and answer and not answer.startswith("Error"):
+        answer_cache.store(prompt, embedding, answer, [r["id"] for r in semantic_search_results])
+
+
+async def get_answer_async(prompt, retrieval=None):
+    """
+    Async variant of get_answer that never blocks the event loop and serves
+    repeated or near-duplicate questions from the answer cache.
+
+    Args:
+        prompt (str): The user's question or prompt
+        retrieval (dict): Retrieval settings for this question; answers
+            retrieved with custom settings bypass the answer cache
+
+    Returns:
+        str: The direct answer from the LLM
+    """
+    use_cache = not retrieval
+    embedding, cached, semantic_search_results = await _retrieve(prompt, use_cache, retrieval)
+    if cached is not None:
+        return cached
+
+    response = await fetch_llm_response_async(prompt, semantic_search_results)
+    answer = _parse_answer(response)
+    if use_cache:
+        _cache_answer(prompt, embedding, answer, semantic_search_results)
+    return answer
+
+
+async def get_session_answer_async(prompt, session, retrieval=None, generation_slot=None):
+    """
+    Answer the next question of a conversation. Follow-ups continue from the
+    context tokens Ollama returned for the previous turn, on the backend that
+    still holds them in its KV cache, and only chunks the model has not seen
+    yet are added to the prompt.
+
+    Args:
+        prompt (str): The user's question
+        session (Session): The conversation
+        retrieval (dict): Retrieval settings for this question
+        generation_slot (callable): Returns an async context manager held
+            while the turn is answered, e.g. ConcurrencyLimiter.slot; only
+            taken once earlier turns of the session are done, so queued
+            turns of one conversation don't hold slots other users need
+
+    Returns:
+        str: The direct answer from the LLM
+    """
+    async with session.lock, generation_slot() if generation_slot else nullcontext():
+        # A follow-up depends on the conversation, so it never uses the shared cache.
+        follow_up = bool(session.turns)
+        use_cache = not follow_up and not retrieval
+        embedding, cached, semantic_search_results = await _retrieve(prompt, use_cache, retrieval)
+        if cached is not None:
+            session_store.record_turn(session, prompt, cached)
+            return cached
+
+        data, used = _build_request(prompt, semantic_search_results, session=session)
+        response, backend_url = await _generate(data, prefer=session.backend_url)
+        answer = _parse_answer(response)
+        if use_cache:
+            _cache_answer(prompt, embedding, answer, semantic_search_results)
+        session_store.record_turn(
+            session, prompt, answer, response.get("context"), backend_url, [r.get("id") for r in used]
+        )
+        return answer
+
+
+async def get_answers_async(prompts, generation_slot=None, retrieval=None):
+    """
+    Answer several questions at once. Retrieval for all of them starts
+    together, so the micro-batchers embed and search them in a few
+    multi-query calls; each generation then runs inside generation_slot,
+    which bounds how many questions reach Ollama at the same time.
+
+    Args:
+        prompts (list): The questions, in order
+        generation_slot (callable): Returns an async context manager held
+            while a question is being generated, e.g. ConcurrencyLimiter.slot
+        retrieval (dict): Retrieval settings for every question
+
+    Returns:
+        list: Per question, {"message": answer} or {"error": reason}, in order
+    """
+    use_cache = not retrieval
+
+    async def answer_one(prompt):
+        embedding, cached, semantic_search_results = await _retrieve(prompt, use_cache, retrieval)
+        if cached is not None:
+            return cached
+        async with generation_slot() if generation_slot else nullcontext():
+            response = await fetch_llm_response_async(prompt, semantic_search_results)
+        answer = _parse_answer(response)
+        if use_cache:
+            _cache_answer(prompt, embedding, answer, semantic_search_results)
+        return answer
+
+    answers = await asyncio.gather(*(answer_one(prompt) for prompt in prompts), return_exceptions=True)
+    return [
+        {"error": str(answer) or type(answer).__name__} if isinstance(answer, Exception) else {"message": answer}
+        for answer in answers
+    ]
+
+
+def _observe_ollama_durations(chunk):
+    # Ollama reports model load and prompt prefill time (in nanoseconds) on
+    # the final response; prefill is what context reuse saves.
+    for key, stage in (("load_duration", "llm_load"), ("prompt_eval_duration", "llm_prefill")):
+        if chunk.get(key):
+            observe_stage(stage, chunk[key] / 1e9)
+
+
+def _parse_answer(response):
+    with timed("parse"):
+        return extract_answer_from_response(response)
+
+
+async def _stream_generate(data, prefer=None, final=None):
+    """
+    Stream a generation from the pool.
+
+    Args:
+        data (dict): The request body for Ollama, with stream set
+        prefer (str): URL of the backend to use if it is healthy
+        final (dict): Filled with the final "context" and the backend "url"
+            once Ollama reports the generation done
+
+    Yields:
+        str: Pieces of the model output as Ollama produces them
+    """
+    start = time.perf_counter()
+    first_token = True
+    try:
+        async with ollama_pool.backend(prefer=prefer) as backend:
+            async with backend.client.stream("POST", "/api/generate", json=data) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise RuntimeError(f"Ollama error: {chunk['error']}")
+                    if chunk.get("response"):
+                        if first_token:
+                            observe_stage("llm_ttft", time.perf_counter() - start)
+                            first_token = False
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        _observe_ollama_durations(chunk)
+                        if final is not None:
+                            final.update(context=chunk.get("context"), url=backend.url)
+                        break
+    finally:
+        observe_stage("llm", time.perf_counter() - start)
+
+
+async def stream_answer(prompt, session=None, retrieval=None, generation_slot=None):
+    """
+    Stream only the "answer" field of the model's JSON reply.
+
+    Args:
+        prompt (str): The user's question or prompt
+        session (Session): Conversation the question belongs to, if any
+        retrieval (dict): Retrieval settings for this question
+        generation_slot (callable): Returns an async context manager held
+            while the answer is generated; taken after the session's lock
+
+    Yields:
+        str: Newly generated answer text
+    """
+    slot = generation_slot() if generation_slot else nullcontext()
+    if session is None:
+        async with slot, aclosing(_stream_answer(prompt, retrieval=retrieval)) as pieces:
+            async for piece in pieces:
+                yield piece
+        return
+    async with session.lock, slot:
+        async with aclosing(_stream_answer(prompt, session, retrieval)) as pieces:
+            async for piece in pieces:
+                yield piece
+
+
+async def _stream_answer(prompt, session=None, retrieval=None):
+    follow_up = session is not None and bool(session.turns)
+    use_cache = not follow_up and not retrieval
+    embedding, cached, semantic_search_results = await _retrieve(prompt, use_cache, retrieval)
+    if cached is not None:
+        yield cached
+        if session is not None:
+            session_store.record_turn(session, prompt, cached)
+        return
+
+    data, used = _build_request(prompt, semantic_search_results, stream=True, session=session)
+    final = {}
+    parser = AnswerStreamParser()
+    # Closing the stream once the answer is complete stops Ollama from
+    # generating the remaining JSON fields nobody reads. A session needs the
+    # context tokens of the final chunk, so there the rest is read unshown.
+    async with aclosing(_stream_generate(data, prefer=session and session.backend_url, final=final)) as tokens:
+        async for token in tokens:
+            piece = parser.feed(token)
+            if piece:
+                yield piece
+            if parser.done and session is None:
+                break
 
+    if not parser.found:
+        # The model never produced an "answer" key; fall back to the regular parser.
+        answer = _parse_answer({"response": parser.raw})
+        yield answer
+    else:
+        # An answer cut off before its closing quote has already been shown,
+        # so the session keeps it, but it is not cached for anyone else.
+        answer = parser.answer
+    if use_cache and (parser.done or not parser.found):
+        _cache_answer(prompt, embedding, answer, semantic_search_results)
+    if session is not None:
+        session_store.record_turn(
+            session, prompt, answer, final.get("context"), final.get("url"), [r.get("id") for r in used]
+        )
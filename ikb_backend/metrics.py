@@ -0,0 +1,169 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; spans a cache hit (~1 ms) to a slow generation.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Stage timings of the request being handled, for its Server-Timing header.
+_request_timings = contextvars.ContextVar("ikb_request_timings", default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in Prometheus text format."""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """A value read from a callback at scrape time."""
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self):
+        return f"# HELP {self.name} {self.help_text}\n# TYPE {self.name} gauge\n{self.name} {self.read()}"
+
+
+stage_duration = Histogram(
+    "ikb_stage_duration_seconds",
+    "Time spent in each stage of answering a question.",
+)
+request_duration = Histogram(
+    "ikb_request_duration_seconds",
+    "Time to produce the response (for streams, the headers) per endpoint and status.",
+)
+_gauges = []
+
+
+def register_gauge(name, help_text, read):
+    _gauges.append(Gauge(name, help_text, read))
+
+
+def observe_stage(stage, seconds):
+    """Record a stage duration in the histogram and in the current request's timings."""
+    stage_duration.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as a stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def start_request_timings():
+    """Begin collecting stage timings for the request in this context."""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def current_timings():
+    """Stage timings of the current request so far, in milliseconds."""
+    return {stage: round(seconds * 1000, 3) for stage, seconds in (_request_timings.get() or {}).items()}
+
+
+def server_timing_header(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings.items())
+
+
+def render_metrics(extra_paths=()):
+    """
+    Render every metric in Prometheus text format.
+
+    Args:
+        extra_paths (iterable): Prometheus text files to append, e.g. the
+            metrics the ingest pipeline writes after each run
+
+    Returns:
+        str: The exposition text
+    """
+    parts = [stage_duration.render(), request_duration.render()]
+    parts.extend(gauge.render() for gauge in _gauges)
+    for path in extra_paths:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                parts.append(f.read().strip())
+    return "\n".join(parts) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request and reports the stage
+    timings collected while handling it in a Server-Timing header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings = start_request_timings()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                # The route template, not the raw path, keeps label cardinality bounded.
+                route = scope.get("route")
+                request_duration.observe(
+                    time.perf_counter() - start,
+                    endpoint=getattr(route, "path", "unmatched"),
+                    status=message["status"],
+                )
+                if timings:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(timings).encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
@@ -0,0 +1,212 @@
+import asyncio
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+# Comma-separated Ollama servers; OLLAMA_URL is still honoured for a single box.
+OLLAMA_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv("OLLAMA_URLS", os.getenv("OLLAMA_URL", "http://localhost:11434")).split(",")
+    if url.strip()
+]
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32"))
+# Longest silence tolerated while waiting for (the next piece of) a generation.
+OLLAMA_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_TIMEOUT_SECONDS", "120"))
+OLLAMA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SECONDS", "5"))
+OLLAMA_HEALTH_INTERVAL_SECONDS = float(os.getenv("OLLAMA_HEALTH_INTERVAL_SECONDS", "15"))
+# How long Ollama keeps the model in memory after a request ("-1" = forever).
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+
+class OllamaBackend:
+    """One Ollama server with its own pooled HTTP client and load counters."""
+
+    def __init__(self, url):
+        self.url = url
+        self.client = None
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.checked_at = None
+
+    def open(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=httpx.Timeout(OLLAMA_TIMEOUT_SECONDS, connect=OLLAMA_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+                ),
+            )
+        return self.client
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def mark_failed(self, error):
+        self.failures += 1
+        self.healthy = False
+        self.last_error = str(error) or type(error).__name__
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaPool:
+    """
+    Routes generations across several Ollama servers.
+
+    Each request goes to the healthy backend with the fewest requests in
+    flight (ties rotate). A backend that refuses connections or times out is
+    taken out of rotation until the periodic health check sees it answer
+    again. If every backend is marked down, all of them are tried anyway so a
+    transient blip doesn't turn into an outage.
+    """
+
+    def __init__(self, urls=OLLAMA_URLS, model=OLLAMA_MODEL, health_interval=OLLAMA_HEALTH_INTERVAL_SECONDS):
+        self.backends = [OllamaBackend(url) for url in urls]
+        self.model = model
+        self.health_interval = health_interval
+        self._rotation = itertools.count()
+        self._health_task = None
+        self._preload_task = None
+
+    @property
+    def size(self):
+        return len(self.backends)
+
+    async def start(self):
+        """
+        Open the clients and start health checks. The model is preloaded on
+        every backend in the background so startup doesn't wait for it.
+        """
+        for backend in self.backends:
+            backend.open()
+        if self._preload_task is None:
+            self._preload_task = asyncio.ensure_future(
+                asyncio.gather(*(self._preload(backend) for backend in self.backends))
+            )
+        if self.health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        for task in (self._preload_task, self._health_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._preload_task = None
+        self._health_task = None
+        for backend in self.backends:
+            await backend.close()
+
+    def _choose(self, exclude=(), prefer=None):
+        for backend in self.backends:
+            # Affinity wins over load: that backend still has the caller's KV cache.
+            if backend.url == prefer and backend.healthy and backend not in exclude:
+                return backend
+        candidates = [b for b in self.backends if b.healthy and b not in exclude]
+        if not candidates:
+            candidates = [b for b in self.backends if b not in exclude] or self.backends
+        least = min(b.outstanding for b in candidates)
+        tied = [b for b in candidates if b.outstanding == least]
+        return tied[next(self._rotation) % len(tied)]
+
+    @asynccontextmanager
+    async def backend(self, exclude=(), prefer=None):
+        """
+        Hold the least-loaded backend for the duration of the block.
+
+        Args:
+            exclude (iterable): Backends not to use, e.g. ones that just failed
+            prefer (str): URL of a backend to use instead, if it is healthy
+
+        Yields:
+            OllamaBackend: The chosen backend; use its client for requests
+        """
+        backend = self._choose(exclude, prefer)
+        backend.open()
+        # Connection failures and timeouts (a hung generation) take the backend
+        # out of rotation; HTTP error statuses don't.
+        backend.outstanding += 1
+        backend.requests += 1
+        try:
+            yield backend
+        except httpx.TransportError as e:
+            backend.mark_failed(e)
+            raise
+        finally:
+            backend.outstanding -= 1
+
+    async def _preload(self, backend):
+        # A generate request without a prompt loads the model and pins it for keep_alive.
+        try:
+            response = await backend.client.post(
+                "/api/generate", json={"model": self.model, "keep_alive": OLLAMA_KEEP_ALIVE}
+            )
+            response.raise_for_status()
+            print(f"Preloaded {self.model} on {backend.url}")
+            return True
+        except httpx.HTTPError as e:
+            backend.mark_failed(e)
+            print(f"Could not preload {self.model} on {backend.url}: {e}")
+            return False
+
+    async def wait_preloaded(self):
+        """
+        Wait for the preload started by start() to finish.
+
+        Returns:
+            list: Per backend, whether the model was loaded
+        """
+        if self._preload_task is None:
+            return [False] * len(self.backends)
+        # Shielded so a cancelled waiter doesn't cancel the preload itself.
+        return await asyncio.shield(self._preload_task)
+
+    async def check_health(self):
+        """Probe every backend once and update its healthy flag."""
+        await asyncio.gather(*(self._check(backend) for backend in self.backends))
+
+    async def _check(self, backend):
+        try:
+            response = await backend.open().get("/api/tags", timeout=OLLAMA_CONNECT_TIMEOUT_SECONDS)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            if backend.healthy:
+                print(f"Ollama backend {backend.url} is down: {e}")
+            backend.mark_failed(e)
+        else:
+            if not backend.healthy:
+                print(f"Ollama backend {backend.url} is back")
+            backend.healthy = True
+        backend.checked_at = time.time()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    def stats(self):
+        return {"model": self.model, "backends": [backend.stats() for backend in self.backends]}
+
+
+ollama_pool = OllamaPool()
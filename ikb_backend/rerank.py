@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+
+# Reranking over-fetches candidates and picks a smaller, more diverse set:
+# neighbouring sections of one page (a parent section and its sub-sections)
+# otherwise fill most of the results with the same text.
+RERANK_ENABLED = os.getenv("IKB_RERANK_ENABLED", "1") == "1"
+RERANK_CANDIDATES = int(os.getenv("IKB_RERANK_CANDIDATES", "24"))
+# Weight of relevance against novelty; 1.0 keeps the retrieval order.
+MMR_LAMBDA = float(os.getenv("IKB_MMR_LAMBDA", "0.7"))
+# Candidates at least this similar (cosine) to a chunk already picked only
+# repeat it and are dropped, so fewer results may be returned.
+MMR_MAX_SIMILARITY = float(os.getenv("IKB_MMR_MAX_SIMILARITY", "0.95"))
+# Chunks kept per page; 0 disables the limit.
+MAX_CHUNKS_PER_PAGE = int(os.getenv("IKB_MAX_CHUNKS_PER_PAGE", "2"))
+
+
+def maximal_marginal_relevance(relevance, embeddings, k, mmr_lambda=MMR_LAMBDA,
+                               max_similarity=MMR_MAX_SIMILARITY, groups=None, max_per_group=0):
+    """
+    Greedily pick candidates that are relevant but unlike the ones already
+    picked. The similarity to the picked set is kept as one vector that is
+    updated with a single matrix row per pick, so selection is O(k * n).
+
+    Args:
+        relevance (numpy.ndarray): Relevance per candidate, scaled to [0, 1]
+        embeddings (numpy.ndarray): Unit-length embedding per candidate (zero
+            rows for candidates without one; they are never penalised)
+        k (int): Number of candidates to pick at most
+        mmr_lambda (float): Weight of relevance against novelty
+        max_similarity (float): Candidates this similar to a picked one are skipped
+        groups (list): Group (e.g. page) per candidate, if picks per group are capped
+        max_per_group (int): Picks allowed per group; 0 disables the cap
+
+    Returns:
+        list: Indices of the picked candidates, in pick order
+    """
+    count = len(relevance)
+    similarity = embeddings @ embeddings.T
+    closest = np.full(count, -1.0, dtype=np.float32)
+    available = np.ones(count, dtype=bool)
+    group_ids = None
+    if groups is not None and max_per_group > 0:
+        index = {}
+        group_ids = np.array([index.setdefault(group, len(index)) for group in groups])
+        picked_per_group = np.zeros(len(index), dtype=int)
+
+    picked = []
+    while len(picked) < k and available.any():
+        # Before the first pick there is nothing to be redundant with.
+        penalty = np.maximum(closest, 0.0) if picked else 0.0
+        scores = np.where(available, mmr_lambda * relevance - (1.0 - mmr_lambda) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        closest = np.maximum(closest, similarity[best])
+        available &= closest < max_similarity
+        if group_ids is not None:
+            picked_per_group[group_ids[best]] += 1
+            if picked_per_group[group_ids[best]] >= max_per_group:
+                available &= group_ids != group_ids[best]
+    return picked
+
+
+def relevance_scores(results):
+    """
+    Relevance of ranked results on a common [0, 1] scale: fused scores are
+    min-max scaled, vector distances (squared L2 on unit vectors) turned
+    back into cosine similarity.
+    """
+    if all(r.get("score") is not None for r in results):
+        scores = np.array([r["score"] for r in results], dtype=np.float32)
+        spread = scores.max() - scores.min()
+        return (scores - scores.min()) / spread if spread > 0 else np.ones(len(scores), dtype=np.float32)
+    distances = np.array(
+        [r["distance"] if r.get("distance") is not None else 2.0 for r in results], dtype=np.float32
+    )
+    return np.clip(1.0 - distances / 2.0, 0.0, 1.0)
+
+
+def rerank(results, embeddings, n_results, mmr_lambda=MMR_LAMBDA,
+           max_per_page=MAX_CHUNKS_PER_PAGE, max_similarity=MMR_MAX_SIMILARITY):
+    """
+    Choose a diverse subset of ranked results.
+
+    Args:
+        results (list): Formatted search results, best first
+        embeddings (numpy.ndarray): One embedding per result (zero rows if unknown)
+        n_results (int): Number of results to return at most
+        mmr_lambda (float): Weight of relevance against novelty
+        max_per_page (int): Results kept per page; 0 disables the limit
+        max_similarity (float): Results this similar to a kept one are dropped
+
+    Returns:
+        list: The chosen results, in pick order
+    """
+    if not results:
+        return []
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1, norms)
+    picked = maximal_marginal_relevance(
+        relevance_scores(results), embeddings, n_results, mmr_lambda, max_similarity,
+        groups=[(r.get("metadata") or {}).get("pageId") or r.get("page_title") for r in results],
+        max_per_group=max_per_page,
+    )
+    return [results[i] for i in picked]
@@ -0,0 +1,114 @@
+import asyncio
+import os
+
+from ikb_backend.db import (
+    current_lexical_path,
+    get_documents,
+    get_embeddings,
+    run_in_retrieval_executor,
+    semantic_search_async,
+)
+from ikb_backend.lexical import lexical_searcher
+from ikb_backend.metrics import timed
+from ikb_backend.rerank import (
+    MAX_CHUNKS_PER_PAGE,
+    MMR_LAMBDA,
+    MMR_MAX_SIMILARITY,
+    RERANK_CANDIDATES,
+    RERANK_ENABLED,
+    rerank,
+)
+
+# "hybrid" fuses BM25 keyword hits with vector hits; "vector" is dense only.
+RETRIEVAL_MODE = os.getenv("IKB_RETRIEVAL_MODE", "hybrid")
+RRF_K = int(os.getenv("IKB_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("IKB_HYBRID_CANDIDATES", "20"))
+N_RESULTS = int(os.getenv("IKB_N_RESULTS", "6"))
+# Keyword hits scoring below this fraction of the best hit only matched
+# common terms and would dilute the fusion.
+LEXICAL_MIN_SCORE_RATIO = float(os.getenv("IKB_LEXICAL_MIN_SCORE_RATIO", "0.25"))
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merge ranked ID lists: each list contributes 1 / (k + rank) per ID.
+
+    Args:
+        rankings (list): Lists of IDs, best first
+        k (int): Damping constant; larger values flatten rank differences
+
+    Returns:
+        list: (id, fused score) pairs, best first
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+async def retrieve(query_text, query_embedding=None, n_results=N_RESULTS, rerank_results=RERANK_ENABLED,
+                   mmr_lambda=MMR_LAMBDA, max_per_page=MAX_CHUNKS_PER_PAGE, max_similarity=MMR_MAX_SIMILARITY,
+                   scope=None):
+    """
+    Retrieve context for a question. In hybrid mode the vector search and the
+    BM25 keyword search run concurrently and are merged by reciprocal rank
+    fusion, so exact identifiers (service names, env vars, error codes) are
+    found even when their embedding is not close. With reranking, more
+    candidates are retrieved and a diverse subset of them is returned (see
+    rerank.rerank).
+
+    Args:
+        query_text (str): The user's question
+        query_embedding (numpy.ndarray): Precomputed embedding of query_text
+        n_results (int): Number of results to return (at most, when reranking)
+        rerank_results (bool): Whether to rerank for diversity
+        mmr_lambda (float): Weight of relevance against novelty
+        max_per_page (int): Results kept per page; 0 disables the limit
+        max_similarity (float): Results this similar to a kept one are dropped
+        scope (list): Space keys to search; None searches every space
+
+    Returns:
+        list: Formatted results, best first. Hybrid results carry a fused
+        "score" and the "sources" that found them.
+    """
+    if not rerank_results:
+        return await _retrieve_candidates(query_text, query_embedding, n_results, scope)
+
+    candidates = await _retrieve_candidates(query_text, query_embedding, max(RERANK_CANDIDATES, n_results), scope)
+    with timed("rerank"):
+        embeddings = await run_in_retrieval_executor(get_embeddings, [r["id"] for r in candidates])
+        return rerank(candidates, embeddings, n_results, mmr_lambda, max_per_page, max_similarity)
+
+
+async def _retrieve_candidates(query_text, query_embedding, n_results, scope=None):
+    lexical_path = current_lexical_path()
+    if RETRIEVAL_MODE != "hybrid" or not lexical_searcher.available(lexical_path):
+        return await semantic_search_async(query_text, n_results, query_embedding, scope)
+
+    candidates = max(HYBRID_CANDIDATES, n_results)
+    vector_results, lexical_hits = await asyncio.gather(
+        semantic_search_async(query_text, candidates, query_embedding, scope),
+        run_in_retrieval_executor(lexical_searcher.search, query_text, candidates, lexical_path, scope),
+    )
+
+    top_score = lexical_hits[0][1] if lexical_hits else 0.0
+    lexical_ids = [doc_id for doc_id, score in lexical_hits if score >= top_score * LEXICAL_MIN_SCORE_RATIO]
+    fused = reciprocal_rank_fusion([[r["id"] for r in vector_results], lexical_ids])[:n_results]
+
+    by_id = {r["id"]: r for r in vector_results}
+    missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+    if missing:
+        for result in await run_in_retrieval_executor(get_documents, missing):
+            by_id[result["id"]] = result
+
+    lexical_set = set(lexical_ids)
+    vector_set = set(by_id) - set(missing)
+    results = []
+    for doc_id, score in fused:
+        result = by_id.get(doc_id)
+        if result is None:
+            continue  # deleted since the keyword index was written
+        sources = [name for name, ids in (("vector", vector_set), ("lexical", lexical_set)) if doc_id in ids]
+        results.append(dict(result, score=score, sources=sources))
+    return results
@@ -1,10 +1,63 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from functools import partial
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import asyncio
+import httpx
+import os
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
-from ikb_backend.llm import get_answer
+from ikb_backend.cache import answer_cache
+from ikb_backend.concurrency import ConcurrencyLimiter, OverloadedError
+from ikb_backend.db import DB_PATH, batching_stats, index_stats, shutdown_executor, watch_index_versions
+from ikb_backend.llm import get_answer_async, get_answers_async, get_session_answer_async, stream_answer
+from ikb_backend.metrics import MetricsMiddleware, current_timings, register_gauge, render_metrics
+from ikb_backend.ollama_pool import ollama_pool
+from ikb_backend.sessions import session_store
+from ikb_backend.streaming import sse_event
+from ikb_backend.warmup import warmup
 
-app = FastAPI()
+MAX_CONCURRENT_REQUESTS = int(os.getenv("IKB_MAX_CONCURRENT_REQUESTS", "8"))
+MAX_BATCH_PROMPTS = int(os.getenv("IKB_MAX_BATCH_PROMPTS", "64"))
+# Upper bound on the n_results a request may ask for.
+MAX_REQUEST_RESULTS = int(os.getenv("IKB_MAX_REQUEST_RESULTS", "20"))
+MAX_SCOPE_SPACES = 64
+# Beyond this many waiting requests (or this long a wait) new requests get 503.
+MAX_QUEUED_REQUESTS = int(os.getenv("IKB_MAX_QUEUED_REQUESTS", "32"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("IKB_QUEUE_TIMEOUT_SECONDS", "30"))
+
+limiter = ConcurrencyLimiter(MAX_CONCURRENT_REQUESTS, MAX_QUEUED_REQUESTS, QUEUE_TIMEOUT_SECONDS)
+
+# Written by the ingest pipeline after every run; served alongside our own metrics.
+INGEST_METRICS_PATH = os.path.join(DB_PATH, "ingest_metrics.prom")
+
+register_gauge("ikb_requests_in_flight", "Chat requests holding a concurrency slot.", lambda: limiter.in_flight)
+register_gauge("ikb_requests_waiting", "Chat requests waiting for a concurrency slot.", lambda: limiter.waiting)
+register_gauge("ikb_batch_questions_waiting", "Batch questions waiting for a concurrency slot.", lambda: limiter.batch_waiting)
+register_gauge("ikb_requests_rejected_total", "Chat requests turned away with 503.", lambda: limiter.rejected)
+register_gauge("ikb_ready", "1 once startup warmup has finished, as reported by /readyz.", lambda: int(warmup.ready))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await ollama_pool.start()
+    # Models and indexes load in the background; /readyz says when they're done.
+    warmup.start()
+    index_watcher = asyncio.create_task(watch_index_versions())
+    yield
+    index_watcher.cancel()
+    try:
+        await index_watcher
+    except asyncio.CancelledError:
+        pass
+    await warmup.stop()
+    await ollama_pool.close()
+    shutdown_executor()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -13,18 +66,146 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(OverloadedError)
+async def overloaded(request, exc):
+    return JSONResponse(
+        status_code=503,
+        content={"message": f"Server is busy, please retry shortly ({exc})"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(httpx.TimeoutException)
+async def generation_timed_out(request, exc):
+    return JSONResponse(status_code=504, content={"message": "Timed out waiting for the language model"})
+
+@app.exception_handler(httpx.ConnectError)
+async def generation_unavailable(request, exc):
+    # Raised once every Ollama backend has refused the connection.
+    return JSONResponse(
+        status_code=503,
+        content={"message": "The language model is unavailable, please retry shortly"},
+        headers={"Retry-After": "5"},
+    )
+
+@app.exception_handler(httpx.HTTPStatusError)
+async def generation_failed(request, exc):
+    # Ollama answered with an error, e.g. the model is missing or failed to load.
+    return JSONResponse(
+        status_code=502,
+        content={"message": f"The language model returned an error ({exc.response.status_code})"},
+    )
+
+class RetrievalOptions(BaseModel):
+    # Unset fields keep the server's configured defaults.
+    n_results: Optional[int] = Field(default=None, ge=1, le=MAX_REQUEST_RESULTS)
+    rerank: Optional[bool] = None
+    mmr_lambda: Optional[float] = Field(default=None, ge=0, le=1)
+    max_per_page: Optional[int] = Field(default=None, ge=0)
+    max_similarity: Optional[float] = Field(default=None, gt=0, le=1)
+    # Confluence space keys to search, e.g. ["ENG", "OPS"]; omitted searches every space.
+    scope: Optional[List[str]] = Field(default=None, min_length=1, max_length=MAX_SCOPE_SPACES)
+
+    def settings(self):
+        """Keyword arguments for retrieval.retrieve, or None if nothing was overridden."""
+        settings = self.model_dump(exclude_none=True)
+        if "rerank" in settings:
+            settings["rerank_results"] = settings.pop("rerank")
+        return settings or None
 
 class PromptRequest(BaseModel):
     prompt: str
     context: str
+    # Client-chosen conversation ID; follow-ups sent with the same ID see the earlier turns.
+    session_id: Optional[str] = Field(default=None, max_length=128)
+    retrieval: Optional[RetrievalOptions] = None
+
+class BatchPromptRequest(BaseModel):
+    prompts: List[str] = Field(min_length=1, max_length=MAX_BATCH_PROMPTS)
+    context: str = ""
+    retrieval: Optional[RetrievalOptions] = None
+
+def retrieval_settings(request):
+    return request.retrieval.settings() if request.retrieval else None
 
 @app.post("/v1/chat")
 async def process_prompt(request: PromptRequest):
     prompt = request.prompt
     context = request.context
-    answer = get_answer(prompt)
+    retrieval = retrieval_settings(request)
+    if request.session_id:
+        # The slot is taken once earlier turns of the session are done.
+        answer = await get_session_answer_async(
+            prompt, session_store.get(request.session_id), retrieval, generation_slot=limiter.slot
+        )
+        return {"message": answer, "session_id": request.session_id}
+    async with limiter.slot():
+        answer = await get_answer_async(prompt, retrieval)
     return {"message": answer}
 
+@app.post("/v1/chat/stream")
+async def process_prompt_stream(request: PromptRequest):
+    prompt = request.prompt
+    session = session_store.get(request.session_id) if request.session_id else None
+    retrieval = retrieval_settings(request)
+    # Reject before the 200 and the event stream have started.
+    limiter.check_admission()
+
+    async def events():
+        answer = ""
+        try:
+            async for piece in stream_answer(prompt, session, retrieval, generation_slot=limiter.slot):
+                answer += piece
+                yield sse_event({"token": piece})
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+            return
+        # Headers went out before any work was done, so timings travel with the last event.
+        yield sse_event({"message": answer, "timings": current_timings()}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/v1/chat/batch")
+async def process_prompt_batch(request: BatchPromptRequest):
+    # Retrieval for the whole batch is coalesced; each generation takes a
+    # slot from the shared limiter, so a batch never holds more than the
+    # concurrency cap. The batch is admitted as a whole: its questions aren't
+    # turned away one by one, and while they wait they don't count against
+    # the queue limit, so a large batch can't get single requests rejected.
+    limiter.check_admission()
+    results = await get_answers_async(
+        request.prompts, generation_slot=partial(limiter.slot, bounded=False), retrieval=retrieval_settings(request)
+    )
+    return {"results": results}
+
+@app.delete("/v1/chat/sessions/{session_id}")
+async def end_session(session_id: str):
+    return {"deleted": session_store.delete(session_id)}
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process is up and serving, whether or not warmup is done.
+    return {"status": "ok", "warmup": warmup.stats()}
+
+@app.get("/readyz")
+async def readyz():
+    stats = warmup.stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics([INGEST_METRICS_PATH]), media_type="text/plain; version=0.0.4")
+
+@app.get("/v1/stats")
+async def stats():
+    return {"concurrency": limiter.stats(), "cache": answer_cache.stats(), "batching": batching_stats(), "ollama": ollama_pool.stats(), "sessions": session_store.stats(), "index": index_stats(), "warmup": warmup.stats()}
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=3000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=3000)
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+from array import array
+from collections import OrderedDict, deque
+
+SESSION_MAX_SESSIONS = int(os.getenv("IKB_SESSION_MAX_SESSIONS", "1000"))
+SESSION_TTL_SECONDS = float(os.getenv("IKB_SESSION_TTL_SECONDS", "1800"))
+# Turns replayed as text when the model context can't be reused.
+SESSION_MAX_TURNS = int(os.getenv("IKB_SESSION_MAX_TURNS", "6"))
+# Ollama context arrays longer than this are dropped; the conversation then
+# continues from the text history, re-prefilled once.
+SESSION_MAX_CONTEXT_TOKENS = int(os.getenv("IKB_SESSION_MAX_CONTEXT_TOKENS", "4096"))
+# Bound on the context tokens held across all sessions (4 bytes each).
+SESSION_TOTAL_CONTEXT_TOKENS = int(os.getenv("IKB_SESSION_TOTAL_CONTEXT_TOKENS", "2000000"))
+
+
+class Session:
+    """
+    One conversation: its recent turns, the context tokens Ollama returned
+    after the last turn, the backend that holds its KV cache, and the chunks
+    already sent to the model.
+    """
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.turns = deque(maxlen=SESSION_MAX_TURNS)
+        self.context = None
+        self.backend_url = None
+        self.sent_chunk_ids = set()
+        self.updated_at = time.monotonic()
+        # Turns of one conversation are answered one after another.
+        self.lock = asyncio.Lock()
+
+    @property
+    def context_tokens(self):
+        return len(self.context) if self.context is not None else 0
+
+    def history_text(self):
+        return "\n".join(f"Q: {question}\nA: {answer}" for question, answer in self.turns)
+
+
+class SessionStore:
+    """In-memory sessions with LRU eviction, idle expiry and a context-token budget."""
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS,
+                 total_context_tokens=SESSION_TOTAL_CONTEXT_TOKENS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.total_context_tokens = total_context_tokens
+        self._sessions = OrderedDict()
+        self._context_tokens = 0
+        self.evictions = 0
+
+    def get(self, session_id):
+        """
+        Return the session with this ID, starting a new one if it is unknown
+        or expired.
+
+        Args:
+            session_id (str): Client-chosen conversation ID
+
+        Returns:
+            Session: The session, marked as most recently used
+        """
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self._sessions[session_id] = session
+            self._evict()
+        self._sessions.move_to_end(session_id)
+        session.updated_at = time.monotonic()
+        return session
+
+    def record_turn(self, session, question, answer, context=None, backend_url=None, chunk_ids=()):
+        """
+        Remember a finished turn and the model context to continue from.
+
+        Args:
+            session (Session): The conversation
+            question (str): The user's question
+            answer (str): The answer given
+            context (list): Context tokens returned by Ollama, if any
+            backend_url (str): Ollama server that generated the answer
+            chunk_ids (iterable): Chunks included in this turn's prompt
+        """
+        session.turns.append((question, answer))
+        session.backend_url = backend_url or session.backend_url
+        # A session evicted mid-turn still finishes its turn, but is no longer counted.
+        tracked = self._sessions.get(session.id) is session
+        if tracked:
+            self._sessions.move_to_end(session.id)
+            self._context_tokens -= session.context_tokens
+        if context and len(context) <= SESSION_MAX_CONTEXT_TOKENS:
+            session.context = array("I", context)
+            session.sent_chunk_ids.update(chunk_ids)
+        else:
+            # Too long to keep (or not returned): the next turn starts a fresh
+            # model context from the text history.
+            session.context = None
+            session.sent_chunk_ids.clear()
+        if tracked:
+            self._context_tokens += session.context_tokens
+        session.updated_at = time.monotonic()
+        self._evict()
+
+    def delete(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._context_tokens -= session.context_tokens
+        return session is not None
+
+    def _expire(self):
+        if self.ttl_seconds <= 0:
+            return
+        now = time.monotonic()
+        # Least recently used sessions come first.
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.updated_at < self.ttl_seconds:
+                break
+            self.delete(session.id)
+            self.evictions += 1
+
+    def _evict(self):
+        while self._sessions and (
+            len(self._sessions) > self.max_sessions or self._context_tokens > self.total_context_tokens
+        ):
+            session_id = next(iter(self._sessions))
+            self.delete(session_id)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "context_tokens": self._context_tokens,
+            "evictions": self.evictions,
+        }
+
+
+session_store = SessionStore()
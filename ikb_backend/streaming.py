@@ -0,0 +1,137 @@
+import json
+import re
+
+_ANSWER_KEY = re.compile(r'"answer"\s*:\s*"')
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class AnswerStreamParser:
+    """
+    Incrementally extracts the "answer" string from the JSON object the model
+    is generating, so answer text can be forwarded while the rest of the JSON
+    (context_used, confidence, notes) is still being produced.
+
+    Feed raw model tokens in order; each call returns the newly decoded part of
+    the answer. If the model does not answer in JSON at all, the raw text is
+    passed through unchanged.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.answer = ""
+        self._state = "start"
+        self._pending = ""
+        self._escape = None
+        self._high_surrogate = None
+
+    @property
+    def found(self):
+        """True once the start of the "answer" value has been seen."""
+        return self._state in ("raw", "answer", "done")
+
+    @property
+    def done(self):
+        return self._state == "done"
+
+    def feed(self, text):
+        """
+        Consume the next piece of model output.
+
+        Args:
+            text (str): Raw text as streamed by the model
+
+        Returns:
+            str: Newly decoded answer text (may be empty)
+        """
+        self.raw += text
+
+        if self._state == "start":
+            stripped = text.lstrip()
+            if not stripped:
+                return ""
+            if stripped[0] in "{`":
+                self._state = "seek"
+            else:
+                self._state = "raw"
+
+        if self._state == "raw":
+            self.answer += text
+            return text
+
+        if self._state == "seek":
+            self._pending += text
+            match = _ANSWER_KEY.search(self._pending)
+            if not match:
+                # Keep only a tail long enough to contain a split key.
+                self._pending = self._pending[-32:]
+                return ""
+            text = self._pending[match.end():]
+            self._pending = ""
+            self._state = "answer"
+
+        if self._state == "answer":
+            piece = self._decode(text)
+            self.answer += piece
+            return piece
+
+        return ""
+
+    def _decode(self, text):
+        out = []
+        for ch in text:
+            if self._state != "answer":
+                break
+            if self._escape is not None:
+                self._escape += ch
+                if self._escape[0] == "u":
+                    if len(self._escape) < 5:
+                        continue
+                    out.append(self._decode_unicode(self._escape[1:]))
+                else:
+                    out.append(_SIMPLE_ESCAPES.get(ch, ch))
+                self._escape = None
+            elif ch == "\\":
+                self._escape = ""
+            elif ch == '"':
+                self._state = "done"
+            else:
+                out.append(ch)
+        return "".join(out)
+
+    def _decode_unicode(self, hex_digits):
+        try:
+            code = int(hex_digits, 16)
+        except ValueError:
+            return "\\u" + hex_digits
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+            return ""
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self._high_surrogate = None
+        return chr(code)
+
+
+def sse_event(data, event=None):
+    """
+    Format a Server-Sent Events frame.
+
+    Args:
+        data (dict): JSON-serializable payload
+        event (str): Optional event name
+
+    Returns:
+        str: The encoded SSE frame
+    """
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# Layout written by the ingest pipeline (embedding-cron-jobs/injest/snapshot.py).
+CURRENT_FILE = "CURRENT"
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json"
+LEXICAL_FILE = "lexical_index.sqlite3"
+
+# How often searches look at CURRENT for a newer snapshot.
+SNAPSHOT_CHECK_SECONDS = float(os.getenv("IKB_SNAPSHOT_CHECK_SECONDS", "5"))
+# Rows scored per matrix product; bounds the float32 copy made of a float16 snapshot.
+SCAN_BLOCK_ROWS = 65536
+
+
+def _partition_rows(ranges):
+    # A [start, stop] pair, or a list of them for a space spread over several ranges.
+    if ranges and isinstance(ranges[0], int):
+        ranges = [ranges]
+    if len(ranges) == 1:
+        return slice(*ranges[0])
+    return np.concatenate([np.arange(start, stop) for start, stop in ranges])
+
+
+class Snapshot:
+    """
+    One published index version: a memory-mapped embedding matrix, its
+    records and the keyword index built alongside them. partitions maps each
+    space key to its rows: a range when they are contiguous, as they are with
+    one collection per space, otherwise an array of row indices.
+    """
+
+    def __init__(self, path, name):
+        self.name = name
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        with open(os.path.join(path, RECORDS_FILE), encoding="utf-8") as f:
+            records = json.load(f)
+        if "records" in records:
+            # Written a record at a time: [id, document, metadata] per row.
+            self.ids = [record[0] for record in records["records"]]
+            self.documents = [record[1] for record in records["records"]]
+            self.metadatas = [record[2] for record in records["records"]]
+        else:
+            self.ids = records["ids"]
+            self.documents = records["documents"]
+            self.metadatas = records["metadatas"]
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        if "partitions" in records:
+            self.partitions = {key: _partition_rows(ranges) for key, ranges in records["partitions"].items()}
+        else:
+            # Versions published before partitioning: rows are not grouped.
+            spaces = np.array([(metadata or {}).get("spaceKey", "") for metadata in self.metadatas], dtype=object)
+            self.partitions = {key: np.flatnonzero(spaces == key) for key in set(spaces)}
+        lexical_path = os.path.join(path, LEXICAL_FILE)
+        # Versions published before keyword indexes were included have none.
+        self.lexical_path = lexical_path if os.path.exists(lexical_path) else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_blocks(self, scope=None, size=SCAN_BLOCK_ROWS):
+        """
+        Rows to scan, in blocks of at most size rows.
+
+        Args:
+            scope (iterable): Space keys to search; None for every row
+
+        Yields:
+            slice or numpy.ndarray: Row indices of one block
+        """
+        if scope is None:
+            ranges = [slice(0, len(self))]
+        else:
+            ranges = [self.partitions[key] for key in sorted(set(scope)) if key in self.partitions]
+        for rows in ranges:
+            if isinstance(rows, slice):
+                for start in range(rows.start, rows.stop, size):
+                    yield slice(start, min(start + size, rows.stop))
+            else:
+                for start in range(0, len(rows), size):
+                    yield rows[start:start + size]
+
+
+class VectorIndex:
+    """
+    Exact cosine top-k over the latest snapshot published by the ingest
+    pipeline. Embeddings are normalised at export, so a single matrix
+    product scores a whole batch of queries; argpartition then picks the
+    top k without sorting every row.
+    """
+
+    def __init__(self, root, check_seconds=SNAPSHOT_CHECK_SECONDS):
+        self.root = root
+        self.check_seconds = check_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.swaps = 0
+
+    def available(self):
+        return self.snapshot() is not None
+
+    def loaded(self):
+        """
+        The snapshot being served, without checking for a newer one. It never
+        loads or waits for a load, so the event loop may call it.
+        """
+        return self._snapshot
+
+    def snapshot(self):
+        """
+        The current snapshot, reloading it if ingest published a newer one.
+
+        Loading reads the whole records file, so this is only called off the
+        event loop. While one thread loads a new version, the others keep
+        using the previous one instead of waiting for it.
+        """
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.check_seconds:
+            return self._snapshot
+        if not self._lock.acquire(blocking=self._snapshot is None):
+            return self._snapshot
+        try:
+            if self._snapshot is None or now - self._checked_at >= self.check_seconds:
+                self._checked_at = now
+                self._refresh()
+        finally:
+            self._lock.release()
+        return self._snapshot
+
+    def _refresh(self):
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding="utf-8") as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            return
+        if not name or (self._snapshot is not None and self._snapshot.name == name):
+            return
+        try:
+            snapshot = Snapshot(os.path.join(self.root, name), name)
+        except (OSError, ValueError) as e:
+            # Keep serving the previous snapshot rather than failing queries.
+            print(f"Could not load vector snapshot {name}: {e}")
+            return
+        print(f"Loaded vector snapshot {name} ({len(snapshot)} chunks)")
+        # Readers holding the old snapshot keep using it until they finish.
+        self._snapshot = snapshot
+        self.swaps += 1
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.name if snapshot is not None else None,
+            "chunks": len(snapshot) if snapshot is not None else 0,
+            "partitions": len(snapshot.partitions) if snapshot is not None else 0,
+            "swaps": self.swaps,
+        }
+
+    def search(self, query_embeddings, n_results=6, scope=None):
+        """
+        Exact nearest neighbours for a batch of query embeddings.
+
+        Args:
+            query_embeddings (numpy.ndarray): (queries, dimensions) matrix
+            n_results (int): Number of results per query
+            scope (iterable): Space keys to search; None searches every space
+
+        Returns:
+            list: Per query, (id, document, metadata, distance) tuples, nearest
+            first. Distances are squared L2 between unit vectors (2 - 2 * cosine),
+            the same scale as Chroma's default space.
+        """
+        snapshot = self.snapshot()
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if snapshot is None or not len(snapshot):
+            return [[] for _ in range(len(queries))]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        matrix = snapshot.embeddings
+        blocks = list(snapshot.row_blocks(scope))
+        scanned = np.concatenate(
+            [np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows for rows in blocks]
+            or [np.zeros(0, dtype=int)]
+        )
+        if not len(scanned):
+            return [[] for _ in range(len(queries))]
+
+        # Columns follow the scanned rows; scanned maps a column back to its row.
+        scores = np.empty((len(queries), len(scanned)), dtype=np.float32)
+        column = 0
+        for rows in blocks:
+            block = np.asarray(matrix[rows], dtype=np.float32)
+            scores[:, column:column + len(block)] = queries @ block.T
+            column += len(block)
+
+        k = min(n_results, len(scanned))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, columns in zip(scores, top):
+            columns = columns[np.argsort(-query_scores[columns])]
+            results.append([
+                (snapshot.ids[row], snapshot.documents[row], snapshot.metadatas[row],
+                 float(max(2.0 - 2.0 * query_scores[column], 0.0)))
+                for column, row in zip(columns, scanned[columns])
+            ])
+        return results
+
+    def embeddings(self, ids):
+        """
+        Look up the (unit-length) embeddings of records in the current snapshot.
+
+        Returns:
+            numpy.ndarray: One float32 row per ID, zeros for IDs not present
+        """
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return np.zeros((len(ids), 0), dtype=np.float32)
+        vectors = np.zeros((len(ids), snapshot.embeddings.shape[1]), dtype=np.float32)
+        for i, doc_id in enumerate(ids):
+            row = snapshot.rows.get(doc_id)
+            if row is not None:
+                vectors[i] = snapshot.embeddings[row]
+        return vectors
+
+    def get(self, ids):
+        """
+        Look up records by ID in the current snapshot.
+
+        Returns:
+            list: (id, document, metadata) tuples for the IDs present, in the order given
+        """
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return []
+        return [
+            (doc_id, snapshot.documents[row], snapshot.metadatas[row])
+            for doc_id in ids
+            if (row := snapshot.rows.get(doc_id)) is not None
+        ]
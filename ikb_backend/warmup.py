@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+
+from ikb_backend import db
+from ikb_backend.ollama_pool import ollama_pool
+
+# Warm the embedding model, the vector index and the Ollama model in the
+# background after startup, so the first requests after a restart don't pay
+# for loading them. /readyz reports 503 until warmup has finished.
+WARMUP_ENABLED = os.getenv("IKB_WARMUP_ENABLED", "1") == "1"
+# Whether the replica only reports ready once Ollama has loaded the model;
+# turn off where Ollama is shared and warmed independently.
+READY_REQUIRES_OLLAMA = os.getenv("IKB_READY_REQUIRES_OLLAMA", "1") == "1"
+
+
+def _warm_embedding():
+    # The first call loads the ONNX model and initialises its session.
+    db.embed_query("warmup")
+
+
+def _warm_index():
+    # Maps the current snapshot; Chroma is only warmed if queries will go to
+    # it (the chroma engine, or no snapshot published yet).
+    if db.VECTOR_ENGINE == "snapshot" and db.vector_index.available():
+        return
+    for collection in db.partition_collections().values():
+        # A query with a stored vector loads the collection's HNSW index.
+        records = collection.get(limit=1, include=["embeddings"])
+        if len(records["embeddings"]):
+            collection.query(query_embeddings=[records["embeddings"][0]], n_results=1)
+
+
+async def _warm_ollama():
+    if not any(await ollama_pool.wait_preloaded()):
+        raise RuntimeError(f"no Ollama backend loaded {ollama_pool.model}")
+
+
+class Warmup:
+    """
+    Runs the warmup steps concurrently and records the state and duration
+    of each: "pending", "running", "ready", "failed" or "skipped".
+    """
+
+    def __init__(self, enabled=WARMUP_ENABLED, requires_ollama=READY_REQUIRES_OLLAMA):
+        self.enabled = enabled
+        self.requires_ollama = requires_ollama
+        self.started_at = time.time()
+        self.steps = {
+            name: {"state": "pending" if enabled else "skipped", "seconds": None, "error": None}
+            for name in ("embedding", "index", "ollama")
+        }
+        self._task = None
+
+    def start(self):
+        """Start warmup as a background task of the running event loop."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        started = time.perf_counter()
+        await asyncio.gather(
+            self._step("embedding", db.run_in_retrieval_executor(_warm_embedding)),
+            self._step("index", db.run_in_retrieval_executor(_warm_index)),
+            self._step("ollama", _warm_ollama()),
+        )
+        print(f"Warmup finished in {time.perf_counter() - started:.2f} s: {self.stats()['steps']}")
+
+    async def _step(self, name, work):
+        step = self.steps[name]
+        step["state"] = "running"
+        started = time.perf_counter()
+        try:
+            await work
+        except Exception as e:
+            step["state"] = "failed"
+            step["error"] = str(e) or type(e).__name__
+            print(f"Warmup of {name} failed: {step['error']}")
+        else:
+            step["state"] = "ready"
+        step["seconds"] = round(time.perf_counter() - started, 3)
+
+    @property
+    def ready(self):
+        """True once every step the replica depends on has warmed up (or warmup is off)."""
+        if not all(self.steps[name]["state"] in ("ready", "skipped") for name in ("embedding", "index")):
+            return False
+        if not self.requires_ollama or self.steps["ollama"]["state"] in ("ready", "skipped"):
+            return True
+        # Ollama down at startup: ready once the health check sees a backend answer again.
+        return self.steps["ollama"]["state"] == "failed" and any(b.healthy for b in ollama_pool.backends)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "steps": {name: dict(step) for name, step in self.steps.items()},
+        }
+
+
+warmup = Warmup()
@@ -44,6 +44,8 @@ function App() {
   const [isLoading, setIsLoading] = useState(false);
   const [darkMode, setDarkMode] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // Lets the backend treat follow-up questions as one conversation
+  const sessionId = useRef(crypto.randomUUID());
 
   const theme = createTheme({
     palette: {
@@ -125,6 +127,7 @@ function App() {
       const response = await axios.post('http://localhost:3000/v1/chat', {
         prompt: input,
         context: '', // You can add context here if needed
+        session_id: sessionId.current,
       });
 
       const data = response.data;
@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backend is imported as the ikb_backend package and the ingest job as
+# the top-level injest package, as when each is run from its own directory.
+for path in (ROOT, os.path.join(ROOT, "embedding-cron-jobs")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,25 @@
+import json
+
+from ikb_backend.cache import SemanticCache
+
+
+def test_corrupt_change_lines_are_skipped(tmp_path):
+    changes = tmp_path / "changes.jsonl"
+    changes.write_text("")
+    cache = SemanticCache(changes_path=str(changes), served_version=lambda: None)
+    cache.refresh_invalidations()
+    cache.store("What is the VPN address?", [1.0, 0.0], "vpn.example.com", ["page-1-0"])
+    cache.store("Who owns billing?", [0.0, 1.0], "The payments team", ["page-2-0"])
+
+    with open(changes, "a", encoding="utf-8") as f:
+        f.write('{"ids": ["page-1-0"\n')
+        f.write(json.dumps({"ids": ["page-1-0"]}) + "\n")
+        f.write('{"ids": ["page-2')
+
+    assert cache.lookup("Who owns billing?", [0.0, 1.0]) == "The payments team"
+    assert cache.lookup("What is the VPN address?", [1.0, 0.0]) is None
+
+    # The final line was still being written; it is applied once it is complete.
+    with open(changes, "a", encoding="utf-8") as f:
+        f.write('-0"]}\n')
+    assert cache.lookup("Who owns billing?", [0.0, 1.0]) is None
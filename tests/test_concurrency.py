@@ -0,0 +1,35 @@
+import asyncio
+
+from ikb_backend.concurrency import ConcurrencyLimiter
+
+
+def test_single_request_admitted_while_large_batch_is_queued():
+    async def run():
+        limiter = ConcurrencyLimiter(8, 32, 30)
+        release = asyncio.Event()
+
+        async def batch_question():
+            async with limiter.slot(bounded=False):
+                await release.wait()
+
+        batch = [asyncio.create_task(batch_question()) for _ in range(64)]
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 8
+        assert limiter.batch_waiting == 56
+        assert limiter.waiting == 0
+
+        async def single_request():
+            async with limiter.slot():
+                pass
+
+        single = asyncio.create_task(single_request())
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        assert limiter.rejected == 0
+
+        release.set()
+        await single
+        await asyncio.gather(*batch)
+        assert limiter.stats()["batch_waiting"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+import asyncio
+
+from ikb_backend import llm
+from ikb_backend.sessions import SessionStore
+
+
+def _collect(prompt, session):
+    async def run():
+        return [piece async for piece in llm.stream_answer(prompt, session)]
+    return asyncio.run(run())
+
+
+def test_answer_cut_off_mid_stream_is_recorded_but_not_cached(monkeypatch):
+    store = SessionStore()
+    cached = []
+
+    async def retrieve(prompt, use_cache=True, retrieval=None):
+        return [0.0], None, []
+
+    async def stream_generate(data, prefer=None, final=None):
+        # Ollama stops before the answer string is closed and never reports done.
+        for token in ['{"answer": "Deploys run', " from the", " release bra"]:
+            yield token
+
+    monkeypatch.setattr(llm, "session_store", store)
+    monkeypatch.setattr(llm, "_retrieve", retrieve)
+    monkeypatch.setattr(llm, "_stream_generate", stream_generate)
+    monkeypatch.setattr(llm, "_cache_answer", lambda *args: cached.append(args))
+
+    session = store.get("conversation")
+    pieces = _collect("How do deploys work?", session)
+
+    assert "".join(pieces) == "Deploys run from the release bra"
+    assert list(session.turns) == [("How do deploys work?", "Deploys run from the release bra")]
+    assert session.context is None
+    assert cached == []
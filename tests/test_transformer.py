@@ -0,0 +1,58 @@
+import random
+
+import pytest
+from bs4 import BeautifulSoup
+
+from injest.tokens import count_tokens
+from injest.transformer import chunk_html
+
+WORDS = "alpha beta gamma delta deployment configuration_value kubernetes x , . ( ) API-gateway".split()
+
+
+def _text(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _element(rng):
+    kind = rng.choice(["p", "ul", "pre", "table"])
+    if kind == "p":
+        return f"<p>{_text(rng, rng.randint(5, 200))}</p>"
+    if kind == "ul":
+        items = "".join(f"<li>{_text(rng, rng.randint(3, 60))}</li>" for _ in range(rng.randint(2, 30)))
+        return f"<ul>{items}</ul>"
+    if kind == "pre":
+        return "<pre>" + "\n".join(_text(rng, rng.randint(1, 40)) for _ in range(rng.randint(2, 60))) + "</pre>"
+    rows = "".join(
+        "<tr>" + "".join(f"<td>{_text(rng, rng.randint(1, 20))}</td>" for _ in range(3)) + "</tr>"
+        for _ in range(rng.randint(2, 40))
+    )
+    return f"<table>{rows}</table>"
+
+
+def _page(rng):
+    html = [f"<p>{_text(rng, 300)}</p>"]
+    for s in range(rng.randint(1, 4)):
+        html.append(f"<h2>Section {s} {_text(rng, 3)}</h2>")
+        html.extend(_element(rng) for _ in range(rng.randint(0, 3)))
+        for sub in range(rng.randint(1, 5)):
+            # Long sub-headings make the lead's share of the first piece matter.
+            html.append(f"<h3>Sub {sub} {_text(rng, rng.randint(1, 25))}</h3>")
+            html.extend(_element(rng) for _ in range(rng.randint(1, 4)))
+    return "".join(html)
+
+
+@pytest.mark.parametrize("max_tokens", [128, 256, 512])
+def test_chunks_stay_within_budget_with_sub_headings(max_tokens):
+    rng = random.Random(max_tokens)
+    for _ in range(20):
+        soup = BeautifulSoup(_page(rng), "html.parser")
+        for chunk in chunk_html(soup, max_tokens=max_tokens, overlap_tokens=32):
+            assert count_tokens(chunk["content"]) <= max_tokens
+
+
+def test_split_chunks_are_packed_close_to_budget():
+    paragraphs = "".join(f"<p>step {i} {'word ' * 20}</p>" for i in range(200))
+    soup = BeautifulSoup(f"<h2>Guide</h2>{paragraphs}", "html.parser")
+    chunks = chunk_html(soup, max_tokens=128, overlap_tokens=0)
+    sizes = [count_tokens(chunk["content"]) for chunk in chunks[:-1]]
+    assert min(sizes) > 100
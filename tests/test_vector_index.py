@@ -0,0 +1,48 @@
+import json
+import os
+
+import numpy as np
+
+from ikb_backend import db
+from ikb_backend.vector_index import CURRENT_FILE, EMBEDDINGS_FILE, RECORDS_FILE, VectorIndex
+
+
+def _publish(root, name, ids):
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    np.save(os.path.join(path, EMBEDDINGS_FILE), np.eye(len(ids), 4, dtype=np.float32))
+    with open(os.path.join(path, RECORDS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "documents": ids, "metadatas": [{} for _ in ids]}, f)
+    with open(os.path.join(root, CURRENT_FILE), "w", encoding="utf-8") as f:
+        f.write(name)
+
+
+def test_loop_side_reads_never_load_a_snapshot(tmp_path, monkeypatch):
+    index = VectorIndex(str(tmp_path), check_seconds=0)
+    _publish(str(tmp_path), "v1", ["a", "b"])
+    monkeypatch.setattr(db, "vector_index", index)
+    monkeypatch.setattr(db, "VECTOR_ENGINE", "snapshot")
+
+    assert db.served_index_version() is None
+    assert db.current_lexical_path() is None
+    assert db.index_stats()["engine"] == "chroma"
+    assert index.loaded() is None
+
+    index.snapshot()
+    _publish(str(tmp_path), "v2", ["a", "b", "c"])
+    assert db.served_index_version() == "v1"
+    assert db.index_stats()["version"] == "v1"
+
+    index.snapshot()
+    assert db.served_index_version() == "v2"
+
+
+def test_searches_keep_the_old_snapshot_while_another_thread_loads(tmp_path):
+    index = VectorIndex(str(tmp_path), check_seconds=0)
+    _publish(str(tmp_path), "v1", ["a"])
+    old = index.snapshot()
+    _publish(str(tmp_path), "v2", ["a", "b"])
+
+    with index._lock:
+        assert index.snapshot() is old
+    assert index.snapshot().name == "v2"